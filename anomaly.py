@@ -0,0 +1,220 @@
+import logging
+import re
+import threading
+
+import numpy as np
+
+from drum_data import REFILL_JUMP
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------
+# SETTINGS
+# ---------------------------------------------------------
+ALPHA = 0.05          # EWMA weight of the newest rate sample
+WARMUP = 20           # samples before a drum's own baseline is trusted
+Z_THRESHOLD = 4.0     # how far above baseline / peers a drop must be
+SENSOR_JUMP = 20.0    # a single-tick drop this large is not a physical leak
+MIN_INTERVAL = 5.0    # seconds between scored readings of the same drum
+REL_FLOOR = 0.25      # rate noise floor, relative to the expected rate
+WINDOW = 30           # readings kept per drum as evidence
+HOLD_SECONDS = 60     # how long a detection stays on the status banner
+
+
+def chemical_of(drum_name: str) -> str:
+    """
+    "DRUM 1 (AZ EBR200G+)" -> "AZ EBR200G+"
+    """
+    match = re.search(r"\(([^)]*)\)", drum_name)
+    return match.group(1) if match else ""
+
+
+# ---------------------------------------------------------
+# STREAMING DETECTOR (VECTORIZED OVER THE WHOLE FLEET)
+# ---------------------------------------------------------
+class AnomalyDetector:
+    """
+    Keeps one row of rolling statistics per drum in flat numpy arrays.
+    Each tick scores every drum's consumption rate against its own EWMA
+    baseline and against the current rates of drums with the same
+    chemical, without a Python loop over drums.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self.rows = {}
+        self.names = []
+        self.groups = {}
+        self._lock = threading.Lock()
+        self._last_names = None
+        self._last_idx = None
+        self.tick = 0
+        self.active = {}  # drum -> detection dict
+        self._alloc(capacity)
+
+    def _alloc(self, capacity):
+        def grow(old, fill, shape=()):
+            new = np.full((capacity,) + shape, fill, dtype=float)
+            if old is not None:
+                new[: len(old)] = old
+            return new
+
+        get = self.__dict__.get
+        self.last_percent = grow(get("last_percent"), np.nan)
+        self.last_ts = grow(get("last_ts"), np.nan)
+        self.mean = grow(get("mean"), 0.0)
+        self.var = grow(get("var"), 0.0)
+        self.count = grow(get("count"), 0.0)
+        self.group = grow(get("group"), 0.0).astype(np.int64)
+        self.capacity = capacity
+
+        # Evidence ring: one column per tick, one row slot per drum
+        window = np.full((WINDOW, capacity), np.nan)
+        if get("window") is not None:
+            window[:, : self.window.shape[1]] = self.window
+        self.window = window
+
+    def _index(self, names):
+        """
+        Row index for every name, registering new drums on the way.
+        The mapping is reused while the fleet order is unchanged.
+        """
+        if names is self._last_names or names == self._last_names:
+            return self._last_idx
+
+        idx = np.empty(len(names), dtype=np.int64)
+        for i, name in enumerate(names):
+            row = self.rows.get(name)
+            if row is None:
+                row = len(self.names)
+                if row >= self.capacity:
+                    self._alloc(self.capacity * 2)
+                self.rows[name] = row
+                self.names.append(name)
+                self.group[row] = self.groups.setdefault(
+                    chemical_of(name), len(self.groups)
+                )
+            idx[i] = row
+
+        self._last_names, self._last_idx = list(names), idx
+        return idx
+
+    def score(self, names, percents, ts: float):
+        """
+        Fold one tick of readings into the baselines.
+        Returns a list of new detections (dicts with evidence windows).
+        """
+        with self._lock:
+            idx = self._index(names)
+            cur = np.asarray(percents, dtype=float)
+
+            prev = self.last_percent[idx]
+            dt = ts - self.last_ts[idx]
+            dt_h = dt / 3600
+            fresh = dt >= MIN_INTERVAL  # NaN (first reading) compares False
+            seen = fresh | np.isnan(dt)
+            if not seen.any():
+                return []  # another session already scored this tick
+
+            ring = idx[seen]
+            self.tick += 1
+            col = self.tick % WINDOW
+            self.window[col] = np.nan
+            self.window[col, ring] = cur[seen]
+
+            used = prev - cur
+            refill = used < -REFILL_JUMP
+            valid = fresh & ~refill
+            rate = np.where(valid, used / np.where(fresh, dt_h, 1.0), 0.0)
+
+            # Own baseline
+            mean, var, n = self.mean[idx], self.var[idx], self.count[idx]
+            floor = (REL_FLOOR * np.abs(mean)) ** 2 + 1e-6
+            z_self = (rate - mean) / np.sqrt(var + floor)
+
+            # Peers: same chemical, this tick
+            g = self.group[idx]
+            w = valid.astype(float)
+            n_g = np.bincount(g, weights=w)
+            s_g = np.bincount(g, weights=rate * w)
+            sq_g = np.bincount(g, weights=rate * rate * w)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                g_mean = np.where(n_g > 0, s_g / n_g, 0.0)
+                g_var = np.where(n_g > 0, sq_g / n_g - g_mean ** 2, 0.0)
+            g_var = np.maximum(g_var, 0.0) + (REL_FLOOR * np.abs(g_mean)) ** 2 + 1e-6
+            z_peer = (rate - g_mean[g]) / np.sqrt(g_var[g])
+            has_peers = n_g[g] > 2
+
+            hit = (
+                valid
+                & (n >= WARMUP)
+                & (z_self > Z_THRESHOLD)
+                & (~has_peers | (z_peer > Z_THRESHOLD))
+            )
+
+            # Only normal samples feed the baseline, so a leak never
+            # becomes the new normal
+            learn = valid & ~hit
+            delta = rate - mean
+            new_mean = mean + ALPHA * delta
+            new_var = (1 - ALPHA) * (var + ALPHA * delta * delta)
+            rows = idx[learn]
+            self.mean[rows] = new_mean[learn]
+            self.var[rows] = new_var[learn]
+            self.count[rows] += 1
+
+            self.last_percent[ring] = cur[seen]
+            self.last_ts[ring] = ts
+
+            detections = []
+            for i in np.flatnonzero(hit):
+                row = idx[i]
+                kind = "sensor fault" if used[i] > SENSOR_JUMP else "leak"
+                order = (np.arange(WINDOW) + col + 1) % WINDOW
+                evidence = [round(float(v), 2) for v in self.window[order, row] if not np.isnan(v)]
+                detection = {
+                    "drum": self.names[row],
+                    "kind": kind,
+                    "ts": ts,
+                    "rate": float(rate[i]),
+                    "baseline": float(mean[i]),
+                    "peer_rate": float(g_mean[g[i]]),
+                    "evidence": evidence,
+                }
+                self.active[detection["drum"]] = detection
+                detections.append(detection)
+                logger.warning(
+                    "Possible %s on %s: %.2f %%/h vs baseline %.2f, peers %.2f; last readings %s",
+                    kind, detection["drum"], detection["rate"],
+                    detection["baseline"], detection["peer_rate"], evidence,
+                )
+
+            return detections
+
+    def observe(self, drums, ts: float):
+        """
+        Convenience wrapper for the dashboard's list of drum dicts.
+        """
+        return self.score(
+            [d["name"] for d in drums], [d["percent"] for d in drums], ts
+        )
+
+    def normal_rates(self, names):
+        """
+        Baseline consumption in % per hour for those of `names` whose
+        baseline is warmed up.
+        """
+        with self._lock:
+            rows = [(name, self.rows[name]) for name in names if name in self.rows]
+            return {
+                name: float(self.mean[row]) for name, row in rows if self.count[row] >= WARMUP
+            }
+
+    def current(self, ts: float):
+        """
+        Detections raised within the last HOLD_SECONDS.
+        """
+        with self._lock:
+            self.active = {
+                k: v for k, v in self.active.items() if ts - v["ts"] <= HOLD_SECONDS
+            }
+            return list(self.active.values())
@@ -0,0 +1,417 @@
+import argparse
+import gzip
+import hmac
+import json
+import logging
+import os
+import threading
+import zlib
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from drum_data import compute_usage_and_prediction, simulate_drum_levels
+from fleet_state import (
+    DEFAULT_SITE,
+    DEFAULT_TENANT,
+    FleetState,
+    seed_default_drums,
+    shard_data_dir,
+    valid_shard_name,
+)
+from forecasting import FORECAST_FILE, load_forecasts
+from ingest import IngestStore
+from metrics import MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------
+# SETTINGS
+# ---------------------------------------------------------
+API_PREFIX = "/api/v1"
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+GZIP_MIN_BYTES = 512
+MAX_INGEST_BYTES = 16 * 1024 * 1024  # compressed and decompressed
+INGEST_TOKEN = os.environ.get("DASHBOARD_INGEST_TOKEN")
+LOOPBACK = ("127.0.0.1", "::1", "::ffff:127.0.0.1")
+
+DRUM_FIELDS = (
+    "name",
+    "percent",
+    "level",
+    "mid_sensor",
+    "low_sensor",
+    "installed",
+    "replaced",
+    "days_in_service",
+    "usage_rate",
+    "est_empty",
+    "forecast",
+)
+
+
+class ApiError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def _iso(value):
+    return value.isoformat(timespec="minutes") if value else None
+
+
+# ---------------------------------------------------------
+# SNAPSHOTS (BUILT ONCE PER SHARD VERSION AND SECOND)
+# ---------------------------------------------------------
+class Snapshot:
+    """
+    Everything the dashboard shows for one shard at one reading tick.
+    Encoded responses are memoized on the snapshot, so pollers asking
+    for the same page within a tick cost one dict lookup.
+    """
+
+    def __init__(self, tenant: str, site: str, version: str, rows: list):
+        self.tenant = tenant
+        self.site = site
+        self.version = version
+        self.rows = rows
+        self.by_name = {row["name"]: row for row in rows}
+        self.responses = {}
+
+
+class SnapshotStore:
+    def __init__(self, fleet: FleetState):
+        self.fleet = fleet
+        self._snapshots = {}
+        self._forecasts = {}  # path -> (mtime, forecasts)
+        self._lock = threading.Lock()
+
+    def _forecasts_for(self, tenant: str, site: str):
+        path = os.path.join(shard_data_dir(tenant, site), FORECAST_FILE)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return {}
+        cached = self._forecasts.get(path)
+        if cached is None or cached[0] != mtime:
+            cached = self._forecasts[path] = (mtime, load_forecasts(path))
+        return cached[1]
+
+    def get(self, tenant: str, site: str) -> Snapshot:
+        shard = self.fleet.shard(tenant, site)
+        if tenant == DEFAULT_TENANT and site == DEFAULT_SITE:
+            seed_default_drums(shard)  # same demo drums the dashboard shows
+        fleet = shard.snapshot()
+        now = datetime.now().replace(microsecond=0)
+        version = f"{fleet['version']}.{int(now.timestamp())}"
+
+        key = (tenant, site)
+        snapshot = self._snapshots.get(key)
+        if snapshot is not None and snapshot.version == version:
+            return snapshot
+
+        with self._lock:
+            snapshot = self._snapshots.get(key)
+            if snapshot is None or snapshot.version != version:
+                snapshot = self._build(tenant, site, version, fleet, now)
+                self._snapshots[key] = snapshot
+            return snapshot
+
+    def _build(self, tenant, site, version, fleet, now):
+        forecasts = self._forecasts_for(tenant, site)
+        rows = []
+        for drum in simulate_drum_levels(list(fleet["drums"]), now):
+            name = drum["name"]
+            installed, replaced, days_in_service, usage_rate, est_text = (
+                compute_usage_and_prediction(fleet["drums"][name], drum["percent"], now)
+            )
+            forecast = forecasts.get(name)
+            rows.append(
+                dict(
+                    drum,
+                    installed=_iso(installed),
+                    replaced=_iso(replaced),
+                    days_in_service=days_in_service,
+                    usage_rate=round(usage_rate, 4),
+                    est_empty=forecast["expected"][:10] if forecast else est_text,
+                    forecast=forecast,
+                )
+            )
+        return Snapshot(tenant, site, version, rows)
+
+
+# ---------------------------------------------------------
+# HTTP
+# ---------------------------------------------------------
+def _one(query, name, default=None):
+    values = query.get(name)
+    return values[0] if values else default
+
+
+def _int_param(query, name, default, lo, hi):
+    raw = _one(query, name)
+    if raw is None:
+        return default
+    try:
+        value = int(raw)
+    except ValueError:
+        raise ApiError(400, f"'{name}' must be an integer")
+    if not lo <= value <= hi:
+        raise ApiError(400, f"'{name}' must be between {lo} and {hi}")
+    return value
+
+
+def _gunzip(body: bytes, limit: int) -> bytes:
+    """
+    gzip.decompress with a cap on the output, so a small compressed body
+    can't expand into gigabytes.
+    """
+    inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    data = inflater.decompress(body, limit)
+    if inflater.unconsumed_tail:
+        raise ApiError(413, "decompressed body too large")
+    if not inflater.eof:
+        raise ValueError("truncated gzip body")
+    return data
+
+
+def _shard_params(query):
+    tenant = _one(query, "tenant", DEFAULT_TENANT)
+    site = _one(query, "site", DEFAULT_SITE)
+    if not (valid_shard_name(tenant) and valid_shard_name(site)):
+        raise ApiError(400, "'tenant' and 'site' may only contain letters, digits, '-' and '_'")
+    return tenant, site
+
+
+def _fields_param(query):
+    raw = _one(query, "fields")
+    if not raw:
+        return None
+    fields = tuple(f for f in raw.split(",") if f)
+    unknown = [f for f in fields if f not in DRUM_FIELDS]
+    if unknown:
+        raise ApiError(400, f"unknown field(s): {', '.join(unknown)}")
+    return fields
+
+
+def _select(row, fields):
+    return row if fields is None else {f: row[f] for f in fields}
+
+
+class SnapshotHandler(BaseHTTPRequestHandler):
+    """
+    GET /api/v1/fleet?tenant=&site=&fields=a,b&page=1&page_size=100
+    GET /api/v1/drums/<name>?tenant=&site=&fields=a,b
+    GET /api/v1/metrics[?format=prometheus]   (dashboard sessions, see metrics.py)
+    POST /api/v1/ingest?tenant=&site=   (edge agents, see ingest.py; needs
+        "Authorization: Bearer $DASHBOARD_INGEST_TOKEN", or a local client
+        when no token is set)
+    """
+
+    protocol_version = "HTTP/1.1"  # keep-alive for pollers
+
+    def do_GET(self):
+        try:
+            self._get()
+        except ApiError as exc:
+            self._send_json(exc.status, {"error": str(exc)})
+
+    def do_POST(self):
+        try:
+            self._post()
+        except ApiError as exc:
+            self._send_json(exc.status, {"error": str(exc)})
+
+    def _check_ingest_auth(self):
+        # The only write endpoint: a bearer token when one is configured,
+        # otherwise only agents on this host
+        token = self.server.ingest_token
+        if token:
+            sent = self.headers.get("Authorization", "")
+            if not hmac.compare_digest(sent.encode(), f"Bearer {token}".encode()):
+                raise ApiError(401, "missing or wrong ingest token")
+        elif self.client_address[0] not in LOOPBACK:
+            raise ApiError(403, "set DASHBOARD_INGEST_TOKEN to accept remote agents")
+
+    def _post(self):
+        url = urlsplit(self.path)
+        if url.path != f"{API_PREFIX}/ingest":
+            raise ApiError(404, "not found")
+        self._check_ingest_auth()
+        query = parse_qs(url.query)
+        tenant, site = _shard_params(query)
+
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            raise ApiError(400, "bad Content-Length")
+        if not 0 < length <= MAX_INGEST_BYTES:
+            raise ApiError(413 if length else 411, "body missing or too large")
+        body = self.rfile.read(length)
+        try:
+            if self.headers.get("Content-Encoding") == "gzip":
+                body = _gunzip(body, MAX_INGEST_BYTES)
+            batch = json.loads(body)
+            agent, readings = batch["agent"], batch["readings"]
+            queue = batch.get("queue", "")
+            if not (
+                isinstance(agent, str)
+                and 0 < len(agent) <= 200
+                and isinstance(queue, str)
+                and len(queue) <= 64
+                and isinstance(readings, list)
+            ):
+                raise ValueError("bad batch")
+        except (OSError, ValueError, KeyError, TypeError, AttributeError, zlib.error):
+            raise ApiError(400, "expected a (gzip'd) JSON batch with 'agent' and 'readings'")
+
+        try:
+            acked = self.server.ingest.ingest(tenant, site, agent, readings, queue)
+        except ValueError as exc:
+            raise ApiError(400, f"bad reading: {exc}")
+        self._send_json(200, {"acked": acked})
+
+    def _get(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        if url.path == f"{API_PREFIX}/metrics":
+            return self._metrics(query)
+        tenant, site = _shard_params(query)
+        fields = _fields_param(query)
+        use_gzip = "gzip" in self.headers.get("Accept-Encoding", "")
+
+        if url.path == f"{API_PREFIX}/fleet":
+            page = _int_param(query, "page", 1, 1, 10**9)
+            page_size = _int_param(query, "page_size", DEFAULT_PAGE_SIZE, 1, MAX_PAGE_SIZE)
+            key = ("fleet", fields, page, page_size, use_gzip)
+            build = lambda snap: self._fleet_body(snap, fields, page, page_size)
+        elif url.path.startswith(f"{API_PREFIX}/drums/"):
+            name = unquote(url.path[len(f"{API_PREFIX}/drums/"):])
+            key = ("drum", name, fields, use_gzip)
+            build = lambda snap: self._drum_body(snap, name, fields)
+        else:
+            raise ApiError(404, "not found")
+
+        demo = tenant == DEFAULT_TENANT and site == DEFAULT_SITE
+        if not demo and not self.server.snapshots.fleet.exists(tenant, site):
+            raise ApiError(404, f"no drums for tenant '{tenant}', site '{site}'")
+        snapshot = self.server.snapshots.get(tenant, site)
+        if not snapshot.rows:
+            raise ApiError(404, f"no drums for tenant '{tenant}', site '{site}'")
+
+        response = snapshot.responses.get(key)
+        if response is None:
+            body = json.dumps(build(snapshot), separators=(",", ":")).encode()
+            encoding = None
+            if use_gzip and len(body) >= GZIP_MIN_BYTES:
+                body = gzip.compress(body, compresslevel=5, mtime=0)
+                encoding = "gzip"
+            variant = zlib.crc32(repr(key[:-1]).encode())
+            etag = f'"{snapshot.version}-{variant:x}{"-gz" if encoding else ""}"'
+            response = snapshot.responses[key] = (etag, body, encoding)
+
+        etag, body, encoding = response
+        if etag in self._if_none_match():
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Vary", "Accept-Encoding")
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _metrics(self, query):
+        if _one(query, "format") == "prometheus":
+            body = self.server.metrics.prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self._send_json(200, {"sessions": self.server.metrics.snapshot()})
+
+    def _if_none_match(self):
+        header = self.headers.get("If-None-Match", "")
+        return {tag.strip().removeprefix("W/") for tag in header.split(",") if tag.strip()}
+
+    @staticmethod
+    def _fleet_body(snapshot, fields, page, page_size):
+        start = (page - 1) * page_size
+        return {
+            "tenant": snapshot.tenant,
+            "site": snapshot.site,
+            "version": snapshot.version,
+            "page": page,
+            "page_size": page_size,
+            "total": len(snapshot.rows),
+            "drums": [_select(row, fields) for row in snapshot.rows[start:start + page_size]],
+        }
+
+    @staticmethod
+    def _drum_body(snapshot, name, fields):
+        row = snapshot.by_name.get(name)
+        if row is None:
+            raise ApiError(404, f"unknown drum '{name}'")
+        return dict(_select(row, fields), version=snapshot.version)
+
+    def _send_json(self, status: int, payload: dict):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Frequent polling would flood stderr
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+
+class SnapshotServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address,
+        fleet: FleetState,
+        metrics: MetricsRegistry = None,
+        ingest_token: str = INGEST_TOKEN,
+    ):
+        super().__init__(address, SnapshotHandler)
+        self.snapshots = SnapshotStore(fleet)
+        self.ingest = IngestStore()
+        self.metrics = metrics or MetricsRegistry()
+        self.ingest_token = ingest_token
+
+
+def start_api_server(
+    fleet: FleetState, host: str = "0.0.0.0", port: int = 8600, metrics: MetricsRegistry = None
+):
+    """
+    Serve the snapshot API from a daemon thread (used by app.py).
+    """
+    server = SnapshotServer((host, port), fleet, metrics)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Read-only JSON snapshot API.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8600)
+    args = parser.parse_args()
+
+    server = SnapshotServer((args.host, args.port), FleetState())
+    print(f"Serving {API_PREFIX} on http://{args.host}:{args.port}")
+    server.serve_forever()
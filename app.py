@@ -1,8 +1,37 @@
+import html
+import logging
+import math
+import os
+import threading
+import time
+
 import streamlit as st
-from datetime import datetime, timedelta
+from datetime import datetime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 from streamlit_autorefresh import st_autorefresh
 import plotly.graph_objects as go
 
+from anomaly import AnomalyDetector, chemical_of
+from api import start_api_server
+from drum_data import compute_usage_and_prediction, simulate_drum_levels
+from export import export
+from fleet_state import (
+    DEFAULT_SITE,
+    DEFAULT_TENANT,
+    FleetState,
+    seed_default_drums,
+    shard_data_dir,
+    valid_shard_name,
+)
+from forecasting import FORECAST_FILE, load_forecasts
+from history import HISTORY_FILE, HistoryRecorder
+from metrics import MetricsRegistry
+from refresh import RefreshScheduler, RerunBudget
+from replay import ReplaySource
+from search import DrumIndex
+from sessions import SessionRegistry, state_size
+from shared_state import make_backend
+
 # ---------------------------------------------------------
 # PAGE SETTINGS
 # ---------------------------------------------------------
@@ -246,104 +275,263 @@ st.markdown(
     unsafe_allow_html=True,
 )
 
-# Auto-refresh every 5s
-st_autorefresh(interval=5000, key="refresh")
+# ---------------------------------------------------------
+# CONSTANTS & FLEET STATE
+# ---------------------------------------------------------
+@st.cache_resource
+def get_fleet_state():
+    # Shared by all sessions. DASHBOARD_STATE_BACKEND shares it with other
+    # dashboard processes (see serve.py); FLEET_SHARD_WORKERS moves shards
+    # to child processes.
+    return FleetState(workers=int(os.environ.get("FLEET_SHARD_WORKERS", "0")))
+
+
+@st.cache_resource
+def get_metrics():
+    # Per-session gauges, served at /api/v1/metrics when the API runs
+    return MetricsRegistry()
+
+
+@st.cache_resource
+def start_snapshot_api(port: int):
+    # JSON API for MES/ERP systems, served from this process (see api.py).
+    # A failure is cached too, so a taken port isn't retried every rerun.
+    try:
+        return start_api_server(get_fleet_state(), port=port, metrics=get_metrics())
+    except OSError as exc:
+        logging.getLogger(__name__).error("Snapshot API not started on port %d: %s", port, exc)
+        return None
+
+
+if os.environ.get("DASHBOARD_API_PORT"):
+    start_snapshot_api(int(os.environ["DASHBOARD_API_PORT"]))
+
+TENANT = st.query_params.get("tenant", DEFAULT_TENANT)
+SITE = st.query_params.get("site", DEFAULT_SITE)
+if not (valid_shard_name(TENANT) and valid_shard_name(SITE)):
+    st.error("Tenant and site may only contain letters, digits, '-' and '_'.")
+    st.stop()
+
+# Only the demo site is seeded; other sites must already have drums, so
+# arbitrary URLs can't create shards (and their caches) without bound
+IS_DEMO_SHARD = TENANT == DEFAULT_TENANT and SITE == DEFAULT_SITE
+if not IS_DEMO_SHARD and not get_fleet_state().exists(TENANT, SITE):
+    st.error(f"Unknown site {html.escape(TENANT)} / {html.escape(SITE)}.")
+    st.stop()
+
+SHARD_DIR = shard_data_dir(TENANT, SITE)
+shard = get_fleet_state().shard(TENANT, SITE)
+if IS_DEMO_SHARD:
+    seed_default_drums(shard)
+
+FLEET = shard.snapshot()
+DRUM_DATES = FLEET["drums"]
+DRUM_NAMES = list(DRUM_DATES)
 
 # ---------------------------------------------------------
-# CONSTANTS & SESSION STATE
+# DRUM LEVELS (SIMULATED, OR REPLAYED WITH ?replay=<speed>)
 # ---------------------------------------------------------
-DRUM_NAMES = [
-    "DRUM 1 (AZ EBR200G+)",
-    "DRUM 2 (AZ EBR200G+)",
-]
+def get_replay_session(path: str, speed: float, start: datetime):
+    # Each session owns its replay (source, baselines, search index), so
+    # it ends with the session and a new speed or start gets a fresh clock
+    key = (path, speed, start)
+    current = st.session_state.get("replay")
+    if current is None or current["key"] != key:
+        stop_replay()
+        st.session_state.replay = {
+            "key": key,
+            "source": ReplaySource(path, speed, start),
+            "anomaly_detector": AnomalyDetector(),
+            "search_index": DrumIndex(SITE),
+        }
+    return st.session_state.replay
+
+
+def stop_replay():
+    current = st.session_state.pop("replay", None)
+    if current is not None:
+        current["source"].close()
+
+
+REPLAY_SPEED = st.query_params.get("replay")
+replay = None
+if REPLAY_SPEED:
+    try:
+        replay_speed = float(REPLAY_SPEED)
+    except ValueError:
+        replay_speed = math.nan
+    if not math.isfinite(replay_speed) or replay_speed <= 0:
+        st.error("?replay must be a positive playback speed, e.g. ?replay=60.")
+        st.stop()
+    replay_from = st.query_params.get("replay_from", "")
+    replay_start = None
+    if replay_from:
+        try:
+            replay_start = datetime.fromisoformat(replay_from)
+        except ValueError:
+            pass
+        if replay_start is None or replay_start.tzinfo is not None:
+            st.error("?replay_from must be a local date/time, e.g. 2024-05-01T08:00.")
+            st.stop()
+    replay_session = get_replay_session(os.path.join(SHARD_DIR, HISTORY_FILE), replay_speed, replay_start)
+    replay = replay_session["source"]
+    now = replay.clock.now()
+    drums = replay.read(now)
+    DRUM_DATES = replay.drum_dates()
+    DRUM_NAMES = [d["name"] for d in drums]
+else:
+    stop_replay()
+    now = datetime.now()
+    drums = simulate_drum_levels(DRUM_NAMES, now)
 
-if "drum_dates" not in st.session_state:
-    st.session_state.drum_dates = {
-        "DRUM 1 (AZ EBR200G+)": {
-            "installed": datetime(2025, 11, 1, 9, 0),
-            "replaced": None,
-        },
-        "DRUM 2 (AZ EBR200G+)": {
-            "installed": datetime(2025, 11, 2, 9, 0),
-            "replaced": None,
-        },
-    }
 
-DRUM_DATES = st.session_state.drum_dates
+@st.cache_resource
+def get_history_recorder(tenant: str, site: str):
+    # One recorder per shard and server process, shared by all sessions;
+    # workers sharing DASHBOARD_STATE_BACKEND take turns per second
+    return HistoryRecorder(
+        os.path.join(shard_data_dir(tenant, site), HISTORY_FILE),
+        make_backend(),
+        f"history/{tenant}/{site}",
+    )
+
+
+if replay is None:
+    get_history_recorder(TENANT, SITE).record(drums, now)
+
+
+@st.cache_resource
+def get_anomaly_detector(tenant: str, site: str):
+    # Baselines must survive reruns and be shared by all sessions of the
+    # shard; a replay has its own so it never disturbs the live ones
+    return AnomalyDetector()
+
+
+if replay is None:
+    anomaly_detector = get_anomaly_detector(TENANT, SITE)
+else:
+    anomaly_detector = replay_session["anomaly_detector"]
+anomaly_detector.observe(drums, now.timestamp())
+anomalies = anomaly_detector.current(now.timestamp())
 
 # ---------------------------------------------------------
-# SIMULATION: DRUM LEVELS (CONSISTENT & TIME-BASED)
+# DRUM SEARCH & PAGINATION (ONLY ONE PAGE OF CARDS IS RENDERED)
 # ---------------------------------------------------------
-def simulate_drum_levels():
-    """
-    Simulate levels for 2 drums in a deterministic way
-    (based on time) so all devices see similar values.
-    """
-    now = datetime.now()
-    t = (now.minute * 60 + now.second) % 100  # 0–99
-
-    # Drum 1: 100 -> 1
-    percent1 = max(1, 100 - t)
-
-    # Drum 2: slightly offset so not identical
-    t2 = (t + 35) % 100
-    percent2 = max(1, 100 - t2)
-
-    drums = []
-
-    for name, percent in zip(DRUM_NAMES, [percent1, percent2]):
-        if percent <= 30:
-            level = "LOW"
-            low_sensor = 1
-            mid_sensor = 0
-        elif percent <= 60:
-            level = "MID"
-            low_sensor = 0
-            mid_sensor = 1
-        else:
-            level = "ABOVE_MID"
-            low_sensor = 0
-            mid_sensor = 0
-
-        drums.append(
-            {
-                "name": name,
-                "percent": percent,
-                "level": level,
-                "mid_sensor": mid_sensor,
-                "low_sensor": low_sensor,
-            }
-        )
+PAGE_SIZE = 20
+
+
+@st.cache_resource
+def get_search_index(tenant: str, site: str):
+    # One index per shard, updated incrementally as drums are registered
+    return DrumIndex(site)
+
+
+if replay is None:
+    search_index = get_search_index(TENANT, SITE)
+else:
+    search_index = replay_session["search_index"]
+search_index.sync(DRUM_NAMES, FLEET["version"] if replay is None else len(DRUM_NAMES))
+
+search_started = time.perf_counter()
+matches = search_index.search(st.session_state.get("drum_search", ""))
+search_ms = (time.perf_counter() - search_started) * 1000
+
+page_count = max(1, -(-len(matches) // PAGE_SIZE))
+if st.session_state.get("drum_page", 1) > page_count:
+    st.session_state.drum_page = page_count
+page = st.session_state.get("drum_page", 1)
+drums_by_name = {d["name"]: d for d in drums}
+page_drums = [
+    drums_by_name[name]
+    for name in matches[(page - 1) * PAGE_SIZE:page * PAGE_SIZE]
+    if name in drums_by_name
+]
+
+# ---------------------------------------------------------
+# AUTO-REFRESH (ADAPTIVE, WITHIN A SERVER-WIDE RERUN BUDGET)
+# ---------------------------------------------------------
+@st.cache_resource
+def get_rerun_budget():
+    return RerunBudget()
+
 
-    return drums
+if "refresh_scheduler" not in st.session_state:
+    st.session_state.refresh_scheduler = RefreshScheduler()
+scheduler = st.session_state.refresh_scheduler
 
+refresh_interval = scheduler.next_interval(
+    page_drums,
+    st.session_state.get("refresh", 0),
+    get_rerun_budget(),
+    anomaly_detector.normal_rates(d["name"] for d in page_drums),
+)
+st_autorefresh(interval=int(refresh_interval * 1000), key="refresh")
 
-drums = simulate_drum_levels()
+# ---------------------------------------------------------
+# SESSION MEMORY (REPORTED IN METRICS, IDLE SESSIONS EVICTED)
+# ---------------------------------------------------------
+@st.cache_resource
+def get_session_registry():
+    return SessionRegistry()
+
+
+SESSION_ID = get_script_run_ctx().session_id
+session_bytes = state_size(st.session_state.to_dict())
+sessions = get_session_registry()
+if sessions.touch(SESSION_ID, session_bytes, scheduler.last_interaction) and replay is not None:
+    # Idle under memory pressure: fall back to the live view, which keeps
+    # nothing per session, instead of being closed
+    stop_replay()
+    del st.query_params["replay"]
+    st.query_params.pop("replay_from", None)
+    st.rerun()
+for evicted in sessions.evict(exclude=SESSION_ID):
+    get_metrics().remove(evicted)
+
+get_metrics().update(
+    SESSION_ID,
+    refresh_interval_seconds=round(refresh_interval, 2),
+    reruns_per_minute=round(scheduler.achieved_rate(), 2),
+    tab_hidden=int(scheduler.hidden),
+    session_state_bytes=session_bytes,
+    search_ms=round(search_ms, 2),
+)
 
 # ---------------------------------------------------------
 # USAGE RATE & PREDICTION
 # ---------------------------------------------------------
-def compute_usage_and_prediction(drum_name: str, percent: float):
-    dates = DRUM_DATES[drum_name]
-    installed = dates["installed"]
-    replaced = dates["replaced"]
-
-    days_in_service = max((datetime.now() - installed).days, 1)
-    usage_rate = (100 - percent) / days_in_service  # % per day
-
-    if usage_rate > 0 and percent > 0:
-        days_left = percent / usage_rate
-        est_empty = datetime.now() + timedelta(days=days_left)
-        est_text = est_empty.strftime("%Y-%m-%d")
-    else:
-        est_text = "N/A"
+@st.cache_data
+def cached_forecasts(path: str, mtime: float):
+    # Keyed on file mtime so a new forecast run is picked up automatically
+    return load_forecasts(path)
 
-    return installed, replaced, days_in_service, usage_rate, est_text
+
+def seasonal_forecast_text(drum_name: str):
+    """
+    Empty date from the seasonal forecasting job (forecasting.py),
+    with its uncertainty band. None until the job has fitted this drum.
+    """
+    path = os.path.join(SHARD_DIR, FORECAST_FILE)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+
+    forecast = cached_forecasts(path, mtime).get(drum_name)
+    if not forecast:
+        return None
+
+    expected = forecast["expected"][:10]
+    early = forecast["early"][:10]
+    late = forecast["late"][:10] if forecast["late"] else "later"
+    if early == expected == late:
+        return expected
+    return f"{expected} ({early} – {late})"
 
 # ---------------------------------------------------------
 # GAUGE RENDERING
 # ---------------------------------------------------------
-def render_gauge(percent: float, level: str):
+def render_gauge(percent: float, level: str, key: str = None):
     if level == "LOW":
         bar_color = "#ef4444"
     elif level == "MID":
@@ -369,21 +557,23 @@ def render_gauge(percent: float, level: str):
         )
     )
     fig.update_layout(margin=dict(l=10, r=10, t=50, b=10), height=280)
-    st.plotly_chart(fig, use_container_width=True)
+    st.plotly_chart(fig, use_container_width=True, key=key)
 
 # ---------------------------------------------------------
 # HEADER
 # ---------------------------------------------------------
+CHEMICALS = html.escape(", ".join(sorted({chemical_of(n) for n in DRUM_NAMES})) or "no chemicals")
+
 with st.container():
     st.markdown(
-        """
+        f"""
         <div class="top-card">
             <p class="top-title">
                 🧪 Smart Chemical Drum Monitoring
             </p>
             <p class="top-subtitle">
-                <span class="pill">1 Company</span>
-                <span class="pill">2 Drums (AZ EBR200G+)</span>
+                <span class="pill">{html.escape(TENANT)} • {html.escape(SITE)}</span>
+                <span class="pill">{len(DRUM_NAMES)} Drums ({CHEMICALS})</span>
                 <span class="pill">Real-time level, usage rate & refill prediction</span>
             </p>
         </div>
@@ -416,27 +606,92 @@ else:
         "</div>"
     )
 
+if anomalies:
+    anomaly_list = ", ".join(f"<b>{html.escape(a['drum'])}</b> ({a['kind']})" for a in anomalies)
+    st.markdown(
+        '<div class="status-card">'
+        f"🚨 <b>ANOMALY:</b> Unusual level drop on {anomaly_list}. "
+        "Check for a leak or a faulty sensor."
+        "</div>",
+        unsafe_allow_html=True,
+    )
+
 st.markdown(status_html, unsafe_allow_html=True)
 st.write(
-    f"🕒 **Last update:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+    f"🕒 **Last update:** {now.strftime('%Y-%m-%d %H:%M:%S')}"
 )
+st.caption(f"🔁 Next refresh in {refresh_interval:.0f}s")
+if replay:
+    c1, c2 = st.columns([4, 1])
+    with c1:
+        st.info(
+            f"⏪ Replaying recorded history at {replay.clock.speed:g}x"
+            + (" – end of recording reached." if replay.finished else ".")
+            + (
+                " The recording is too dense for this speed; skipping ahead to keep up."
+                if replay.lagging
+                else ""
+            )
+        )
+    with c2:
+        st.button("⏮ Restart replay", key="replay_restart", on_click=stop_replay)
 
 # ---------------------------------------------------------
 # DRUM OVERVIEW
 # ---------------------------------------------------------
+def start_editing(name: str):
+    stop_editing()
+    st.session_state.editing = name
+
+
+def stop_editing():
+    name = st.session_state.pop("editing", None)
+    if name:
+        st.session_state.pop(f"{name}_date", None)
+        st.session_state.pop(f"{name}_time", None)
+
+
+def save_installed():
+    name = st.session_state.editing
+    shard.set_installed(
+        name,
+        datetime.combine(st.session_state[f"{name}_date"], st.session_state[f"{name}_time"]),
+    )
+    stop_editing()
+    st.toast(f"Updated installation/replacement time for {name}")
+
+
 st.markdown('<p class="section-title">🗄️ Drum Overview</p>', unsafe_allow_html=True)
 
-col1, col2 = st.columns(2)
+def first_page():
+    st.session_state.drum_page = 1
+
+
+c1, c2 = st.columns([3, 1])
+with c1:
+    st.text_input(
+        "Search drums",
+        key="drum_search",
+        placeholder='Name, site or chemical, e.g. "EBR200G+"',
+        on_change=first_page,
+    )
+with c2:
+    st.number_input(f"Page (of {page_count})", min_value=1, max_value=page_count, key="drum_page")
+st.caption(f"{len(matches)} of {len(DRUM_NAMES)} drums match")
+
+cols = st.columns(2)
 
-for col, drum in zip([col1, col2], drums):
-    with col:
+for i, drum in enumerate(page_drums):
+    with cols[i % 2]:
         name = drum["name"]
         percent = drum["percent"]
         level = drum["level"]
 
         installed, replaced, days_in_service, usage_rate, est_text = compute_usage_and_prediction(
-            name, percent
+            DRUM_DATES[name], percent, now
         )
+        if replay is None:
+            est_text = seasonal_forecast_text(name) or est_text
 
         # Choose badge
         if level == "LOW":
@@ -453,7 +708,7 @@ for col, drum in zip([col1, col2], drums):
         st.markdown(
             f"""
             <div class="drum-header">
-                <p class="drum-title">{name}</p>
+                <p class="drum-title">{html.escape(name)}</p>
                 {badge}
             </div>
             """,
@@ -463,7 +718,7 @@ for col, drum in zip([col1, col2], drums):
         st.markdown('<div class="drum-body">', unsafe_allow_html=True)
 
         # LEFT: Gauge
-        render_gauge(percent, level)
+        render_gauge(percent, level, key=f"{name}_gauge")
 
         # RIGHT: Info & admin controls
         with st.container():
@@ -511,44 +766,145 @@ for col, drum in zip([col1, col2], drums):
             )
             st.markdown("</div>", unsafe_allow_html=True)
 
-            # Admin box
+            # Admin box. Date/time widgets exist only for the drum being
+            # edited, so sessions don't hold widget state for the whole fleet.
             st.markdown('<div class="admin-box">', unsafe_allow_html=True)
-            st.markdown(
-                "**🛠 Admin – Update installation / replacement time**",
-                unsafe_allow_html=True,
-            )
-            st.markdown(
-                "After installing a new drum, update the date & time so the usage rate and prediction are recalculated.",
-                unsafe_allow_html=True,
-            )
-
-            current_installed = installed
-            c1, c2 = st.columns(2)
-            with c1:
-                new_date = st.date_input(
-                    "Installation date",
-                    current_installed.date(),
-                    key=f"{name}_date",
+            if st.session_state.get("editing") != name:
+                st.button(
+                    "✏️ Update installation time",
+                    key=f"{name}_edit",
+                    on_click=start_editing,
+                    args=(name,),
+                    disabled=replay is not None,
+                )
+            else:
+                st.markdown(
+                    "**🛠 Admin – Update installation / replacement time**",
+                    unsafe_allow_html=True,
                 )
-            with c2:
-                new_time = st.time_input(
-                    "Installation time",
-                    current_installed.time(),
-                    key=f"{name}_time",
+                st.markdown(
+                    "After installing a new drum, update the date & time so the usage rate and prediction are recalculated.",
+                    unsafe_allow_html=True,
                 )
 
-            if st.button(f"Save {name}", key=f"{name}_save_button"):
-                new_dt = datetime.combine(new_date, new_time)
-                DRUM_DATES[name]["installed"] = new_dt
-                DRUM_DATES[name]["replaced"] = new_dt
-                st.session_state.drum_dates = DRUM_DATES
-                st.success(f"Updated installation/replacement time for {name}")
+                current_installed = installed
+                c1, c2 = st.columns(2)
+                with c1:
+                    st.date_input(
+                        "Installation date",
+                        current_installed.date(),
+                        key=f"{name}_date",
+                    )
+                with c2:
+                    st.time_input(
+                        "Installation time",
+                        current_installed.time(),
+                        key=f"{name}_time",
+                    )
+
+                c1, c2 = st.columns(2)
+                with c1:
+                    st.button(f"Save {name}", key=f"{name}_save_button", on_click=save_installed)
+                with c2:
+                    st.button("Cancel", key=f"{name}_cancel", on_click=stop_editing)
 
             st.markdown("</div>", unsafe_allow_html=True)  # close admin-box
 
         st.markdown("</div>", unsafe_allow_html=True)  # close drum-body
         st.markdown("</div>", unsafe_allow_html=True)  # close drum-card
 
+# ---------------------------------------------------------
+# EXPORT (RUNS IN A BACKGROUND THREAD)
+# ---------------------------------------------------------
+EXPORT_DOWNLOAD_LIMIT = 200 * 1024 * 1024  # larger files: fetch from disk / CLI
+
+
+@st.cache_resource
+def get_export_jobs():
+    # (tenant, site) -> job; shared so progress survives reruns and sessions
+    return {}
+
+
+def read_export(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def run_export_job(job):
+    def progress(done, total, rows):
+        job["done"], job["total"], job["rows"] = done, total, rows
+
+    try:
+        export(
+            job["dataset"],
+            job["path"],
+            fmt=job["format"],
+            shard_dir=job["shard_dir"],
+            progress=progress,
+        )
+    except Exception as exc:
+        job["error"] = str(exc)
+    job["finished"] = True
+
+
+st.markdown('<p class="section-title">📤 Export history</p>', unsafe_allow_html=True)
+
+export_jobs = get_export_jobs()
+job = export_jobs.get((TENANT, SITE))
+
+if job and not job["finished"]:
+    fraction = job["done"] / job["total"] if job["total"] else 0.0
+    st.progress(min(fraction, 1.0), text=f"Exporting {job['dataset']}: {job['rows']:,} rows")
+else:
+    e1, e2, e3 = st.columns([2, 1, 1])
+    with e1:
+        export_dataset = st.selectbox(
+            "Dataset",
+            ["levels", "rollup", "forecasts"],
+            format_func={
+                "levels": "Level readings",
+                "rollup": "Hourly rollup",
+                "forecasts": "Predicted-empty history",
+            }.get,
+        )
+    with e2:
+        export_format = st.radio("Format", ["csv", "parquet"], horizontal=True)
+    with e3:
+        start_clicked = st.button("Start export", key="export_button")
+
+    if job and job["error"]:
+        st.error(f"Export failed: {job['error']}")
+    elif job:
+        st.success(f"Exported {job['rows']:,} rows to {job['path']}")
+        if job["format"] == "csv" and os.path.getsize(job["path"]) <= EXPORT_DOWNLOAD_LIMIT:
+            # Deferred: the file is only read when the button is clicked,
+            # not on every auto-refresh rerun
+            st.download_button(
+                "Download CSV",
+                data=lambda path=job["path"]: read_export(path),
+                file_name=os.path.basename(job["path"]),
+                mime="text/csv",
+                key="export_download",
+            )
+
+    if start_clicked:
+        ext = "csv" if export_format == "csv" else "parquet"
+        job = {
+            "dataset": export_dataset,
+            "format": export_format,
+            "shard_dir": SHARD_DIR,
+            "path": os.path.join(SHARD_DIR, "exports", f"{export_dataset}.{ext}"),
+            "done": 0,
+            "total": 0,
+            "rows": 0,
+            "error": None,
+            "finished": False,
+        }
+        os.makedirs(os.path.dirname(job["path"]), exist_ok=True)
+        export_jobs[(TENANT, SITE)] = job
+        threading.Thread(target=run_export_job, args=(job,), daemon=True).start()
+        st.rerun()
+
 # ---------------------------------------------------------
 # FOOTER NOTE
 # ---------------------------------------------------------
@@ -0,0 +1,81 @@
+import argparse
+import http.client
+import multiprocessing as mp
+import time
+from datetime import datetime
+
+from api import SnapshotServer
+from fleet_state import FleetState
+
+# ---------------------------------------------------------
+# LOAD TEST: MANY SYSTEMS POLLING THE SNAPSHOT API
+# ---------------------------------------------------------
+# The server runs in its own process (one core). Each client process
+# keeps one connection open and polls like an MES/ERP integration: a
+# gzip'd page of the fleet plus one drum, revalidating with ETags.
+
+PATHS = [
+    "/api/v1/fleet?page=1&page_size=100&fields=name,percent,level,est_empty",
+    "/api/v1/fleet?page=2&page_size=100",
+    "/api/v1/drums/DRUM%207%20(AZ%20EBR200G%2B)",
+]
+
+
+def _serve(port: int, drums: int):
+    fleet = FleetState(backend_spec="memory")
+    shard = fleet.shard("default", "main")
+    for d in range(drums):
+        shard.register_drum(f"DRUM {d} (AZ EBR200G+)", datetime(2025, 11, 1, 9, 0))
+    SnapshotServer(("127.0.0.1", port), fleet).serve_forever()
+
+
+def _client(port: int, seconds: float, results):
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    etags = {}
+    counts = {200: 0, 304: 0}
+    until = time.time() + seconds
+    i = 0
+    while time.time() < until:
+        path = PATHS[i % len(PATHS)]
+        headers = {"Accept-Encoding": "gzip"}
+        if path in etags:
+            headers["If-None-Match"] = etags[path]
+        conn.request("GET", path, headers=headers)
+        response = conn.getresponse()
+        response.read()
+        etags[path] = response.getheader("ETag")
+        counts[response.status] = counts.get(response.status, 0) + 1
+        i += 1
+    results.put(counts)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Snapshot API load test.")
+    parser.add_argument("--port", type=int, default=8699)
+    parser.add_argument("--drums", type=int, default=1000)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    server = mp.Process(target=_serve, args=(args.port, args.drums), daemon=True)
+    server.start()
+    time.sleep(1.0)
+
+    results = mp.Queue()
+    clients = [
+        mp.Process(target=_client, args=(args.port, args.seconds, results))
+        for _ in range(args.clients)
+    ]
+    for c in clients:
+        c.start()
+    totals = {}
+    for _ in clients:
+        for status, n in results.get().items():
+            totals[status] = totals.get(status, 0) + n
+    for c in clients:
+        c.join()
+    server.terminate()
+
+    total = sum(totals.values())
+    print(f"{total / args.seconds:.0f} requests/s over {args.clients} connections "
+          f"({totals.get(200, 0)} x 200, {totals.get(304, 0)} x 304)")
@@ -0,0 +1,62 @@
+import argparse
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from fleet_state import FleetState
+
+# ---------------------------------------------------------
+# BENCHMARK: PER-TENANT RERUN LATENCY VS NUMBER OF TENANTS
+# ---------------------------------------------------------
+# A "rerun" is what the dashboard does for one tenant: read its snapshot
+# and occasionally save an admin change. Other tenants keep writing in
+# between; with per-shard versions that must not slow the viewer down.
+
+
+def build_fleet(tenants: int, drums: int, workers: int):
+    fleet = FleetState(workers=workers)
+    start = datetime(2025, 11, 1, 9, 0)
+    for t in range(tenants):
+        shard = fleet.shard(f"tenant-{t}", "main")
+        for d in range(drums):
+            shard.register_drum(f"DRUM {d} (AZ EBR200G+)", start)
+    return fleet
+
+
+def measure(fleet, tenants: int, drums: int, reruns: int):
+    viewer = fleet.shard("tenant-0", "main")
+    viewer.snapshot()
+    when = datetime(2025, 12, 1, 9, 0)
+
+    samples = []
+    for i in range(reruns):
+        # Someone else saves first
+        other = fleet.shard(f"tenant-{random.randrange(tenants)}", "main")
+        other.set_installed(f"DRUM {random.randrange(drums)} (AZ EBR200G+)", when)
+
+        started = time.perf_counter()
+        snap = viewer.snapshot()
+        for dates in snap["drums"].values():
+            dates["installed"]
+        if i % 10 == 0:
+            viewer.set_installed("DRUM 0 (AZ EBR200G+)", when + timedelta(minutes=i))
+        samples.append(time.perf_counter() - started)
+
+    return statistics.median(samples) * 1000, statistics.quantiles(samples, n=20)[-1] * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-tenant rerun latency benchmark.")
+    parser.add_argument("--drums", type=int, default=200, help="drums per tenant")
+    parser.add_argument("--reruns", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=0, help="shard worker processes")
+    parser.add_argument("--tenants", type=int, nargs="+", default=[1, 10, 100, 1000])
+    args = parser.parse_args()
+
+    print(f"{'tenants':>8} {'median ms':>10} {'p95 ms':>8}")
+    for tenants in args.tenants:
+        fleet = build_fleet(tenants, args.drums, args.workers)
+        median, p95 = measure(fleet, tenants, args.drums, args.reruns)
+        print(f"{tenants:>8} {median:>10.3f} {p95:>8.3f}")
+        fleet.close()
@@ -0,0 +1,86 @@
+import argparse
+import multiprocessing as mp
+import tempfile
+import time
+from datetime import datetime
+
+from fleet_state import FleetState
+
+# ---------------------------------------------------------
+# BENCHMARK: RERUN THROUGHPUT WITH 1, 2, 4, 8 DASHBOARD WORKERS
+# ---------------------------------------------------------
+# Each worker process stands in for one Streamlit server: it reads the
+# shared fleet snapshot in a loop (a rerun) and now and then saves an
+# admin change. Worker 0 also writes a probe drum stamped with the
+# wall clock so the others can measure how fast writes propagate.
+
+DRUMS = 200
+PROBE = "PROBE (propagation)"
+
+
+def _worker(n: int, spec: str, seconds: float, start_at: float, results):
+    shard = FleetState(backend_spec=spec).shard("bench", "main")
+    while time.time() < start_at:
+        time.sleep(0.001)
+
+    reruns = 0
+    max_lag = 0.0
+    seen_version = -1
+    seen_probe = None
+    next_probe = 0.0
+    until = start_at + seconds
+
+    while time.time() < until:
+        snap = shard.snapshot()
+        if snap["version"] != seen_version:
+            seen_version = snap["version"]
+            probe = snap["drums"].get(PROBE)
+            if probe and probe != seen_probe and n != 0:
+                seen_probe = probe
+                lag = (datetime.now() - probe["installed"]).total_seconds()
+                max_lag = max(max_lag, lag)
+
+        reruns += 1
+        if n == 0 and time.time() >= next_probe:
+            shard.set_installed(PROBE, datetime.now())
+            next_probe = time.time() + 0.5
+        elif reruns % 500 == 0:
+            shard.set_installed(f"DRUM {reruns % DRUMS} (AZ EBR200G+)", datetime.now())
+
+    results.put((reruns, max_lag))
+
+
+def run(workers: int, spec: str, seconds: float):
+    shard = FleetState(backend_spec=spec).shard("bench", "main")
+    for d in range(DRUMS):
+        shard.register_drum(f"DRUM {d} (AZ EBR200G+)", datetime(2025, 11, 1, 9, 0))
+
+    results = mp.Queue()
+    start_at = time.time() + 1.0
+    procs = [
+        mp.Process(target=_worker, args=(n, spec, seconds, start_at, results))
+        for n in range(workers)
+    ]
+    for p in procs:
+        p.start()
+    totals = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+
+    reruns = sum(r for r, _ in totals)
+    max_lag = max(lag for _, lag in totals)
+    return reruns / seconds, max_lag
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shared-state throughput benchmark.")
+    parser.add_argument("--backend", default=None, help="default: shm in a temp dir")
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    print(f"{'workers':>8} {'reruns/s':>10} {'max lag ms':>11}")
+    for workers in args.workers:
+        spec = args.backend or f"shm:{tempfile.mkdtemp(prefix='drum-bench-')}"
+        rate, lag = run(workers, spec, args.seconds)
+        print(f"{workers:>8} {rate:>10.0f} {lag * 1000:>11.1f}")
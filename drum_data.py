@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta
+
+# ---------------------------------------------------------
+# DRUM READINGS & USAGE MATHS (NO STREAMLIT, SHARED WITH THE API)
+# ---------------------------------------------------------
+REFILL_JUMP = 5.0  # a rise of more than 5% means the drum was replaced
+
+
+def classify_level(percent: float):
+    """
+    Map a level to (level, mid_sensor, low_sensor):
+      - LOW:  level <= 30%
+      - MID:  30% < level <= 60%
+      - ABOVE MID: level > 60%  (no sensor ON)
+    """
+    if percent <= 30:
+        return "LOW", 0, 1
+    if percent <= 60:
+        return "MID", 1, 0
+    return "ABOVE_MID", 0, 0
+
+
+def simulate_drum_levels(names, now: datetime = None):
+    """
+    Simulate levels for every drum in a deterministic way
+    (based on time) so all devices see similar values.
+    """
+    now = now or datetime.now()
+    t = (now.minute * 60 + now.second) % 100  # 0–99
+
+    drums = []
+
+    for i, name in enumerate(names):
+        # Each drum 100 -> 1, offset so they are not identical
+        percent = max(1, 100 - (t + 35 * i) % 100)
+        level, mid_sensor, low_sensor = classify_level(percent)
+
+        drums.append(
+            {
+                "name": name,
+                "percent": percent,
+                "level": level,
+                "mid_sensor": mid_sensor,
+                "low_sensor": low_sensor,
+            }
+        )
+
+    return drums
+
+
+def compute_usage_and_prediction(dates: dict, percent: float, now: datetime = None):
+    now = now or datetime.now()
+    installed = dates["installed"]
+    replaced = dates["replaced"]
+
+    days_in_service = max((now - installed).days, 1)
+    usage_rate = (100 - percent) / days_in_service  # % per day
+
+    if usage_rate > 0 and percent > 0:
+        days_left = percent / usage_rate
+        est_empty = now + timedelta(days=days_left)
+        est_text = est_empty.strftime("%Y-%m-%d")
+    else:
+        est_text = "N/A"
+
+    return installed, replaced, days_in_service, usage_rate, est_text
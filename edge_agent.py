@@ -0,0 +1,310 @@
+import argparse
+import functools
+import gzip
+import http.client
+import json
+import logging
+import os
+import random
+import socket
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from datetime import datetime
+from urllib.parse import urlencode
+
+from drum_data import simulate_drum_levels
+from fleet_state import DEFAULT_DRUMS
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------
+# SETTINGS
+# ---------------------------------------------------------
+BATCH_ROWS = 1000          # readings per upload
+MAX_ROWS_PER_SEC = 5000    # catch-up throttle after an outage
+BACKOFF_START = 1.0        # seconds, doubled per failed upload
+BACKOFF_MAX = 60.0
+HTTP_TIMEOUT = 10.0
+REJECTED_STATUS = (400, 413, 422)  # the server will never accept this batch
+
+
+# ---------------------------------------------------------
+# DURABLE LOCAL QUEUE (SQLITE)
+# ---------------------------------------------------------
+class EdgeQueue:
+    """
+    Readings survive restarts and network outages in a local SQLite file.
+    `seq` gives a strict upload order; (drum, timestamp) is unique, so a
+    controller repeating a reading does not queue it twice. `queue_id` is
+    random per database file: a recreated queue restarts `seq` at 1, and
+    the server keeps a separate acknowledgement mark for it.
+    """
+
+    def __init__(self, path: str = "edge_queue.db"):
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS readings (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                ts TEXT NOT NULL,
+                drum TEXT NOT NULL,
+                mid INTEGER NOT NULL,
+                low INTEGER NOT NULL,
+                percent REAL,
+                UNIQUE (drum, ts)
+            )
+            """
+        )
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS dead_letters (
+                seq INTEGER PRIMARY KEY,
+                ts TEXT NOT NULL,
+                drum TEXT NOT NULL,
+                mid INTEGER NOT NULL,
+                low INTEGER NOT NULL,
+                percent REAL,
+                reason TEXT NOT NULL,
+                failed_at TEXT NOT NULL
+            )
+            """
+        )
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._db.execute(
+            "INSERT OR IGNORE INTO meta (key, value) VALUES ('queue_id', ?)", (uuid.uuid4().hex,)
+        )
+        self.queue_id = self._db.execute("SELECT value FROM meta WHERE key = 'queue_id'").fetchone()[0]
+        self._lock = threading.Lock()
+
+    def put(self, readings):
+        """
+        readings: iterable of (timestamp, drum, mid_sensor, low_sensor, percent).
+        """
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR IGNORE INTO readings (ts, drum, mid, low, percent) VALUES (?, ?, ?, ?, ?)",
+                readings,
+            )
+
+    def peek(self, limit: int):
+        with self._lock:
+            return self._db.execute(
+                "SELECT seq, ts, drum, mid, low, percent FROM readings ORDER BY seq LIMIT ?",
+                (limit,),
+            ).fetchall()
+
+    def ack(self, seq: int):
+        with self._lock:
+            self._db.execute("DELETE FROM readings WHERE seq <= ?", (seq,))
+
+    def dead_letter(self, seq: int, reason: str):
+        """
+        Move a reading the server rejected out of the upload queue, so it
+        no longer blocks the readings behind it.
+        """
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._db.execute(
+                "INSERT OR REPLACE INTO dead_letters"
+                " SELECT seq, ts, drum, mid, low, percent, ?, ? FROM readings WHERE seq = ?",
+                (reason, datetime.now().isoformat(timespec="seconds"), seq),
+            )
+            self._db.execute("DELETE FROM readings WHERE seq = ?", (seq,))
+            self._db.execute("COMMIT")
+
+    def backlog(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM readings").fetchone()[0]
+
+
+# ---------------------------------------------------------
+# UPLOADER
+# ---------------------------------------------------------
+class Rejected(Exception):
+    """
+    The batch can never be delivered as it is (the server answered 4xx,
+    or it does not encode), as opposed to a failure worth retrying.
+    """
+
+
+def http_transport(url: str, body: bytes, token: str = None) -> dict:
+    headers = {"Content-Type": "application/json", "Content-Encoding": "gzip"}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    request = urllib.request.Request(url, data=body, headers=headers, method="POST")
+    try:
+        with urllib.request.urlopen(request, timeout=HTTP_TIMEOUT) as response:
+            return json.loads(response.read())
+    except urllib.error.HTTPError as exc:
+        if exc.code in REJECTED_STATUS:
+            raise Rejected(f"HTTP {exc.code}: {exc.read()[:200].decode(errors='replace')}") from exc
+        raise
+
+
+class Uploader:
+    """
+    Sends the oldest queued readings in gzip'd batches and deletes them
+    once the server acknowledges them. Failures back off exponentially;
+    after an outage the backlog drains at most MAX_ROWS_PER_SEC so a whole
+    plant reconnecting at once does not flood the central ingest. A
+    rejected batch is halved until the offending reading is found, which
+    is then moved to the queue's dead_letters table.
+    """
+
+    def __init__(
+        self,
+        queue: EdgeQueue,
+        url: str,
+        agent: str,
+        transport=http_transport,
+        batch_rows: int = BATCH_ROWS,
+        max_rows_per_sec: float = MAX_ROWS_PER_SEC,
+    ):
+        self.queue = queue
+        self.url = url
+        self.agent = agent
+        self.transport = transport
+        self.batch_rows = batch_rows
+        self.max_rows_per_sec = max_rows_per_sec
+        self.uploaded = 0
+        self.dead_letters = 0
+        self._batch = batch_rows
+        self._backoff = 0.0
+        self._next_send = 0.0
+
+    def step(self) -> float:
+        """
+        Try one batch. Returns how long to wait before the next step.
+        """
+        now = time.monotonic()
+        if now < self._next_send:
+            return self._next_send - now
+
+        rows = self.queue.peek(self._batch)
+        if not rows:
+            return 1.0
+
+        try:
+            acked = self.transport(self.url, self._encode(rows))["acked"]
+        except Rejected as exc:
+            return self._rejected(rows, exc)
+        except (
+            urllib.error.URLError,
+            http.client.HTTPException,
+            socket.timeout,
+            ConnectionError,
+            KeyError,
+            ValueError,
+        ) as exc:
+            return self._failed(exc)
+
+        self._backoff = 0.0
+        self._batch = min(self._batch * 2, self.batch_rows)
+        self.queue.ack(acked)
+        self.uploaded += len(rows)
+        self._next_send = time.monotonic() + len(rows) / self.max_rows_per_sec
+        return 0.0
+
+    def _encode(self, rows) -> bytes:
+        batch = {"agent": self.agent, "queue": self.queue.queue_id, "readings": rows}
+        try:
+            # No NaN/Infinity: the server's JSON would reject the batch anyway
+            body = json.dumps(batch, separators=(",", ":"), allow_nan=False)
+        except ValueError as exc:
+            raise Rejected(str(exc)) from exc
+        return gzip.compress(body.encode())
+
+    def _rejected(self, rows, exc) -> float:
+        if len(rows) > 1:
+            self._batch = max(1, len(rows) // 2)
+            return 0.0
+        seq = rows[0][0]
+        self.queue.dead_letter(seq, str(exc))
+        self.dead_letters += 1
+        logger.error("Reading %s rejected (%s); moved to dead_letters", rows[0], exc)
+        return 0.0
+
+    def _failed(self, exc) -> float:
+        self._backoff = min(max(self._backoff * 2, BACKOFF_START), BACKOFF_MAX)
+        wait = self._backoff * random.uniform(0.5, 1.0)  # jitter
+        logger.warning("Upload failed (%s); retry in %.1fs", exc, wait)
+        return wait
+
+    def run(self, stop: threading.Event):
+        while not stop.is_set():
+            try:
+                wait = self.step()
+            except Exception as exc:
+                # Keep uploading whatever goes wrong (sqlite3.Error, ...);
+                # the sampler keeps filling the queue either way
+                logger.exception("Upload step failed")
+                wait = self._failed(exc)
+            stop.wait(wait)
+
+
+# ---------------------------------------------------------
+# AGENT (SAMPLING + UPLOADING)
+# ---------------------------------------------------------
+def read_simulated_sensors(names):
+    now = datetime.now().replace(microsecond=0)
+    stamp = now.isoformat()
+    return [
+        (stamp, d["name"], d["mid_sensor"], d["low_sensor"], d["percent"])
+        for d in simulate_drum_levels(names, now)
+    ]
+
+
+class EdgeAgent:
+    def __init__(self, queue: EdgeQueue, uploader: Uploader, read_sensors, interval: float = 5.0):
+        self.queue = queue
+        self.uploader = uploader
+        self.read_sensors = read_sensors
+        self.interval = interval
+        self.stop = threading.Event()
+
+    def run(self):
+        upload = threading.Thread(target=self.uploader.run, args=(self.stop,), daemon=True)
+        upload.start()
+        while not self.stop.is_set():
+            try:
+                self.queue.put(self.read_sensors())
+            except Exception:
+                logger.exception("Sensor read failed")
+            self.stop.wait(self.interval)
+        upload.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Edge store-and-forward agent.")
+    parser.add_argument("--server", default="http://localhost:8600", help="central API base URL")
+    parser.add_argument("--tenant", default="default")
+    parser.add_argument("--site", default="main")
+    parser.add_argument("--agent", default=socket.gethostname())
+    parser.add_argument("--queue", default="edge_queue.db")
+    parser.add_argument("--interval", type=float, default=5.0)
+    parser.add_argument(
+        "--token",
+        default=os.environ.get("DASHBOARD_INGEST_TOKEN"),
+        help="ingest token of the central API (default: $DASHBOARD_INGEST_TOKEN)",
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    queue = EdgeQueue(args.queue)
+    url = f"{args.server}/api/v1/ingest?" + urlencode({"tenant": args.tenant, "site": args.site})
+    agent = EdgeAgent(
+        queue,
+        Uploader(queue, url, args.agent, transport=functools.partial(http_transport, token=args.token)),
+        lambda: read_simulated_sensors(list(DEFAULT_DRUMS)),
+        args.interval,
+    )
+    try:
+        agent.run()
+    except KeyboardInterrupt:
+        agent.stop.set()
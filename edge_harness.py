@@ -0,0 +1,124 @@
+import argparse
+import os
+import resource
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.error
+from datetime import datetime, timedelta
+
+# Keep the harness away from real data; must be set before the imports below
+os.environ.setdefault("DASHBOARD_DATA_DIR", tempfile.mkdtemp(prefix="edge-harness-"))
+
+import edge_agent  # noqa: E402
+from api import SnapshotServer  # noqa: E402
+from edge_agent import EdgeQueue, Uploader, http_transport  # noqa: E402
+from fleet_state import FleetState, shard_data_dir  # noqa: E402
+from history import SENSOR_FILE, iter_csv_rows  # noqa: E402
+
+# ---------------------------------------------------------
+# LOCAL TEST HARNESS: DISCONNECTS AND CATCH-UP
+# ---------------------------------------------------------
+# Runs a central ingest server and one edge agent in-process. The network
+# is cut for a while, then restored; the harness reports the backlog,
+# how fast it drained, memory use, and checks that every reading arrived
+# exactly once and in order.
+
+
+class FlakyNetwork:
+    def __init__(self):
+        self.down = False
+
+    def __call__(self, url, body):
+        if self.down:
+            raise urllib.error.URLError("simulated outage")
+        return http_transport(url, body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Edge agent disconnect harness.")
+    parser.add_argument("--drums", type=int, default=200)
+    parser.add_argument("--hz", type=float, default=10.0, help="readings per drum per second")
+    parser.add_argument("--up", type=float, default=3.0, help="seconds online before the outage")
+    parser.add_argument("--outage", type=float, default=10.0)
+    parser.add_argument("--rate", type=float, default=20000, help="catch-up throttle, rows/s")
+    args = parser.parse_args()
+
+    edge_agent.BACKOFF_MAX = 1.0  # keep retries snappy for the test
+    tracemalloc.start()
+
+    server = SnapshotServer(("127.0.0.1", 0), FleetState(backend_spec="memory"))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/api/v1/ingest?tenant=harness&site=main"
+
+    workdir = tempfile.mkdtemp(prefix="edge-queue-")
+    queue = EdgeQueue(os.path.join(workdir, "queue.db"))
+    network = FlakyNetwork()
+    uploader = Uploader(queue, url, "harness-agent", transport=network, max_rows_per_sec=args.rate)
+
+    stop = threading.Event()
+    produced = 0
+
+    def produce():
+        nonlocal produced
+        t = datetime(2025, 11, 1)
+        names = [f"DRUM {d} (AZ EBR200G+)" for d in range(args.drums)]
+        while not stop.is_set():
+            t += timedelta(seconds=1)
+            stamp = t.isoformat()
+            rows = [(stamp, n, 0, 1, 20.0) for n in names]
+            queue.put(rows + rows[:10])  # repeated readings must be dropped
+            produced += len(rows)
+            time.sleep(1 / args.hz)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    upload = threading.Thread(target=uploader.run, args=(stop,), daemon=True)
+    producer.start()
+    upload.start()
+
+    time.sleep(args.up)
+    network.down = True
+    print(f"network down after {uploader.uploaded:,} uploaded")
+    time.sleep(args.outage)
+    backlog = queue.backlog()
+    network.down = False
+    uploaded_before = uploader.uploaded
+    print(f"network up; backlog {backlog:,} readings")
+
+    started = time.monotonic()
+    while queue.backlog() > args.drums * 2:  # caught up to live traffic
+        time.sleep(0.05)
+    catch_up = time.monotonic() - started
+    rows_caught_up = uploader.uploaded - uploaded_before
+    stop.set()
+    producer.join()
+    upload.join()
+    while queue.peek(1):
+        uploader.step()
+        time.sleep(0.01)
+
+    seen = set()
+    last = ""
+    in_order = True
+    received = os.path.join(shard_data_dir("harness", "main"), SENSOR_FILE)
+    for _, (ts, drum, _, _) in iter_csv_rows(received):
+        key = (ts, drum)
+        if key in seen:
+            raise SystemExit(f"duplicate reading {key}")
+        seen.add(key)
+        in_order &= ts >= last
+        last = ts
+
+    _, peak = tracemalloc.get_traced_memory()
+    print(f"caught up in {catch_up:.2f}s at {rows_caught_up / max(catch_up, 1e-9):,.0f} rows/s")
+    print(f"delivered {len(seen):,} of {produced:,} readings, in order: {in_order}")
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"peak traced memory {peak / 1e6:.1f} MB, max RSS {rss:.0f} MB")
+    server.shutdown()
+    if len(seen) != produced:
+        raise SystemExit("readings lost")
+
+
+if __name__ == "__main__":
+    main()
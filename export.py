@@ -0,0 +1,324 @@
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+from datetime import datetime
+
+from fleet_state import DEFAULT_SITE, DEFAULT_TENANT, shard_data_dir
+from forecasting import FORECAST_HISTORY_FIELDS, FORECAST_HISTORY_FILE
+from history import HISTORY_FILE, iter_csv_rows, iter_history_offsets
+
+# ---------------------------------------------------------
+# SETTINGS
+# ---------------------------------------------------------
+CHUNK_ROWS = 50_000        # rows per write (one Parquet row group)
+PART_ROWS = 1_000_000      # rows per Parquet part file
+
+COLUMNS = {
+    "levels": ["timestamp", "drum", "percent"],
+    "rollup": ["hour", "drum", "readings", "min", "max", "mean", "last"],
+    "forecasts": FORECAST_HISTORY_FIELDS,
+}
+
+PART_FILE = re.compile(r"part-(\d{5})\.parquet(\.tmp)?")
+
+# Parquet column types, matching COLUMNS
+PARQUET_TYPES = {
+    "levels": ["timestamp", "string", "float64"],
+    "rollup": ["timestamp", "string", "int64", "float64", "float64", "float64", "float64"],
+    "forecasts": ["timestamp", "string", "string", "string", "string"],
+}
+
+
+def _source_path(dataset: str, shard_dir: str) -> str:
+    name = FORECAST_HISTORY_FILE if dataset == "forecasts" else HISTORY_FILE
+    return os.path.join(shard_dir, name)
+
+
+# ---------------------------------------------------------
+# ROW PIPELINES
+# ---------------------------------------------------------
+# Every stage yields (offset, row): `offset` is the source byte position
+# up to which everything is reflected in the rows emitted so far, which
+# is what a resumed export restarts from. None means the row is not a
+# resume point (part-way through an hour of rollup rows).
+
+def _levels(path, offset, drums, since, until):
+    # Not `return` past `until`: backfilled edge readings can follow newer rows
+    for end, (ts, drum, percent) in iter_history_offsets(path, offset=offset):
+        if until is not None and ts > until:
+            continue
+        if (since is None or ts >= since) and (drums is None or drum in drums):
+            yield end, (ts, drum, percent)
+
+
+def _rollup(path, offset, drums, since, until):
+    """
+    Hourly min / max / mean / last per drum. Only one hour of buckets is
+    held at a time, so memory is bounded by the number of drums. Rows
+    backfilled out of time order start a new bucket, so an hour can
+    appear more than once.
+    """
+    hour = None
+    buckets = {}
+    position = offset
+    for end, (ts, drum, percent) in _levels(path, offset, drums, since, until):
+        h = ts.replace(minute=0, second=0, microsecond=0)
+        if h != hour:
+            yield from _flush_hour(hour, buckets, position)
+            hour, buckets = h, {}
+
+        b = buckets.get(drum)
+        if b is None:
+            buckets[drum] = [1, percent, percent, percent, percent]
+        else:
+            b[0] += 1
+            b[1] = min(b[1], percent)
+            b[2] = max(b[2], percent)
+            b[3] += percent
+            b[4] = percent
+        position = end
+
+    yield from _flush_hour(hour, buckets, position)
+
+
+def _flush_hour(hour, buckets, position):
+    # Only the hour's last row may be checkpointed: resuming from
+    # `position` skips the whole hour
+    last_drum = next(reversed(buckets), None)
+    for drum, (n, lo, hi, total, last) in buckets.items():
+        row = (hour, drum, n, lo, hi, round(total / n, 3), last)
+        yield (position if drum == last_drum else None), row
+
+
+def _forecasts(path, offset, drums, since, until):
+    for end, row in iter_csv_rows(path, offset):
+        if len(row) != len(FORECAST_HISTORY_FIELDS):
+            continue
+        fitted_at = datetime.fromisoformat(row[0])
+        if until is not None and fitted_at > until:
+            return
+        if (since is None or fitted_at >= since) and (drums is None or row[1] in drums):
+            yield end, (fitted_at, row[1], row[2], row[3], row[4] or None)
+
+
+PIPELINES = {"levels": _levels, "rollup": _rollup, "forecasts": _forecasts}
+
+
+def _chunks(rows, size):
+    chunk = []
+    offset = None
+    for offset, row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield offset, chunk
+            chunk = []
+    if chunk:
+        yield offset, chunk
+
+
+# ---------------------------------------------------------
+# SINKS
+# ---------------------------------------------------------
+class CsvSink:
+    """
+    Appends to one CSV file. Every chunk is a resume point.
+    """
+
+    def __init__(self, path, dataset, state=None):
+        self.path = path
+        columns = COLUMNS[dataset]
+        if state:
+            with open(path, "r+b") as f:
+                f.truncate(state["bytes"])  # drop anything after the checkpoint
+            self._file = open(path, "a", newline="")
+        else:
+            self._file = open(path, "w", newline="")
+            csv.writer(self._file).writerow(columns)
+        self._writer = csv.writer(self._file)
+
+    def write(self, rows):
+        self._writer.writerows(
+            [v.isoformat() if isinstance(v, datetime) else v for v in row] for row in rows
+        )
+        self._file.flush()
+        return True
+
+    def state(self):
+        return {"bytes": self._file.tell()}
+
+    def close(self):
+        self._file.close()
+        return True
+
+
+class ParquetSink:
+    """
+    Writes a directory of Parquet part files, one row group per chunk.
+    A part becomes a resume point once it is closed and renamed.
+    """
+
+    def __init__(self, path, dataset, state=None):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as exc:
+            raise RuntimeError("Parquet export needs the optional 'pyarrow' package") from exc
+        self._pa, self._pq = pa, pq
+        self.path = path
+        self.columns = COLUMNS[dataset]
+        self.schema = pa.schema(
+            [
+                (name, pa.timestamp("s") if kind == "timestamp" else pa.type_for_alias(kind))
+                for name, kind in zip(self.columns, PARQUET_TYPES[dataset])
+            ]
+        )
+        self.parts = state["parts"] if state else 0
+        os.makedirs(path, exist_ok=True)
+        for name in os.listdir(path):
+            # Parts past the checkpoint were never committed; other files
+            # in the directory are not ours and are left alone
+            match = PART_FILE.fullmatch(name)
+            if match and int(match.group(1)) >= self.parts:
+                os.remove(os.path.join(path, name))
+        self._writer = None
+        self._rows = 0
+
+    def _part_path(self, n):
+        return os.path.join(self.path, f"part-{n:05d}.parquet")
+
+    def write(self, rows):
+        columns = dict(zip(self.columns, map(list, zip(*rows))))
+        table = self._pa.Table.from_pydict(columns, schema=self.schema)
+        if self._writer is None:
+            self._writer = self._pq.ParquetWriter(self._part_path(self.parts) + ".tmp", self.schema)
+        self._writer.write_table(table)
+        self._rows += len(rows)
+        if self._rows >= PART_ROWS:
+            return self.close()
+        return False
+
+    def state(self):
+        return {"parts": self.parts}
+
+    def close(self):
+        if self._writer is None:
+            return False
+        self._writer.close()
+        os.replace(self._part_path(self.parts) + ".tmp", self._part_path(self.parts))
+        self._writer = None
+        self._rows = 0
+        self.parts += 1
+        return True
+
+
+SINKS = {"csv": CsvSink, "parquet": ParquetSink}
+
+
+# ---------------------------------------------------------
+# EXPORT JOB
+# ---------------------------------------------------------
+def export(
+    dataset: str,
+    out_path: str,
+    fmt: str = "csv",
+    shard_dir: str = None,
+    drums=None,
+    since: datetime = None,
+    until: datetime = None,
+    resume: bool = True,
+    progress=None,
+):
+    """
+    Stream one dataset ("levels", "rollup" or "forecasts") to CSV or
+    Parquet in constant memory. Progress is reported as
+    progress(bytes_read, bytes_total, rows_written). An interrupted export
+    with the same arguments continues from its last checkpoint.
+    Returns the number of rows written.
+    """
+    shard_dir = shard_dir or shard_data_dir(DEFAULT_TENANT, DEFAULT_SITE)
+    source = _source_path(dataset, shard_dir)
+    total = os.path.getsize(source) if os.path.exists(source) else 0
+    drums = set(drums) if drums else None
+
+    checkpoint_path = f"{out_path}.checkpoint.json"
+    params = {
+        "dataset": dataset,
+        "format": fmt,
+        "source": os.path.abspath(source),
+        "drums": sorted(drums) if drums else None,
+        "since": since.isoformat() if since else None,
+        "until": until.isoformat() if until else None,
+    }
+    checkpoint = None
+    if resume and os.path.exists(checkpoint_path):
+        with open(checkpoint_path) as f:
+            checkpoint = json.load(f)
+        if checkpoint["params"] != params:
+            checkpoint = None  # different export, start over
+
+    offset = checkpoint["offset"] if checkpoint else 0
+    written = checkpoint["rows"] if checkpoint else 0
+    sink = SINKS[fmt](out_path, dataset, checkpoint["sink"] if checkpoint else None)
+
+    def save(position, rows):
+        tmp = f"{checkpoint_path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"params": params, "offset": position, "rows": rows, "sink": sink.state()}, f)
+        os.replace(tmp, checkpoint_path)
+
+    pending = 0
+    done = offset
+    rows = PIPELINES[dataset](source, offset, drums, since, until)
+    for position, chunk in _chunks(rows, CHUNK_ROWS):
+        pending += len(chunk)
+        # A chunk ending mid-hour can't be resumed from; checkpoint later
+        if sink.write(chunk) and position is not None:
+            written += pending
+            pending = 0
+            save(position, written)
+        done = position if position is not None else done
+        if progress:
+            progress(done, total, written + pending)
+
+    sink.close()
+    written += pending
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    if progress:
+        progress(total, total, written)
+    return written
+
+
+def _print_progress(done, total, rows):
+    pct = 100 * done / total if total else 100
+    print(f"\r{pct:5.1f}%  {rows:,} rows", end="", file=sys.stderr, flush=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export level history, rollups or forecasts.")
+    parser.add_argument("dataset", choices=sorted(PIPELINES))
+    parser.add_argument("out", help="output file (csv) or directory (parquet)")
+    parser.add_argument("--format", choices=sorted(SINKS), default="csv")
+    parser.add_argument("--tenant", default=DEFAULT_TENANT)
+    parser.add_argument("--site", default=DEFAULT_SITE)
+    parser.add_argument("--drum", action="append", help="repeat to export several drums")
+    parser.add_argument("--since", type=datetime.fromisoformat)
+    parser.add_argument("--until", type=datetime.fromisoformat)
+    parser.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+    args = parser.parse_args()
+
+    n = export(
+        args.dataset,
+        args.out,
+        fmt=args.format,
+        shard_dir=shard_data_dir(args.tenant, args.site),
+        drums=args.drum,
+        since=args.since,
+        until=args.until,
+        resume=not args.restart,
+        progress=_print_progress,
+    )
+    print(f"\nExported {n:,} rows to {args.out}", file=sys.stderr)
@@ -0,0 +1,272 @@
+import multiprocessing as mp
+import os
+import re
+import threading
+import zlib
+from datetime import datetime
+
+from history import DATA_DIR
+from shared_state import make_backend
+
+# ---------------------------------------------------------
+# DEFAULTS
+# ---------------------------------------------------------
+DEFAULT_TENANT = "default"
+DEFAULT_SITE = "main"
+
+DEFAULT_DRUMS = {
+    "DRUM 1 (AZ EBR200G+)": datetime(2025, 11, 1, 9, 0),
+    "DRUM 2 (AZ EBR200G+)": datetime(2025, 11, 2, 9, 0),
+}
+
+
+SHARD_NAME = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+
+def valid_shard_name(value: str) -> bool:
+    """
+    Tenant and site names end up in file paths, HTML and cache keys,
+    so only plain identifiers are accepted.
+    """
+    return isinstance(value, str) and SHARD_NAME.fullmatch(value) is not None
+
+
+def shard_key(tenant: str, site: str) -> str:
+    return f"fleet/{tenant}/{site}"
+
+
+def shard_data_dir(tenant: str, site: str) -> str:
+    """
+    Per-shard directory for history, forecasts and other files.
+    """
+    if not (valid_shard_name(tenant) and valid_shard_name(site)):
+        raise ValueError(f"invalid tenant/site: {tenant!r}/{site!r}")
+    return os.path.join(DATA_DIR, tenant, site)
+
+
+def seed_default_drums(shard):
+    """
+    Give an empty shard the demo drums so a new site has something to show.
+    """
+    if not shard.snapshot()["drums"]:
+        for name, installed in DEFAULT_DRUMS.items():
+            shard.register_drum(name, installed)
+
+
+# ---------------------------------------------------------
+# ONE SHARD = ONE (TENANT, SITE)
+# ---------------------------------------------------------
+class FleetShard:
+    """
+    Drum metadata for a single tenant site, stored in a shared state
+    backend so every dashboard process sees the same drums. Every write
+    bumps the backend `version`; snapshots and anything stored through
+    `cached()` are only reused while the version is unchanged, so writes
+    here never touch other shards' caches.
+    """
+
+    def __init__(self, tenant: str, site: str, backend=None):
+        self.tenant = tenant
+        self.site = site
+        self.backend = backend or make_backend("memory")
+        self.key = shard_key(tenant, site)
+        self.version = 0
+        self._drums = {}
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def _sync(self):
+        # Cheap version probe; reload only after a write from any process
+        if self.backend.version(self.key) != self.version:
+            version, drums = self.backend.get(self.key)
+            self._drums = drums or {}
+            self.version = version
+            self._cache = {}
+
+    def _write(self, name: str, dates: dict):
+        def apply(drums):
+            drums = dict(drums or {})
+            drums[name] = dates
+            return drums
+
+        with self._lock:
+            self.backend.update(self.key, apply)
+            self._sync()
+            return self.version
+
+    def register_drum(self, name: str, installed: datetime, replaced: datetime = None):
+        return self._write(name, {"installed": installed, "replaced": replaced})
+
+    def set_installed(self, name: str, when: datetime):
+        """
+        Admin save: a new drum was installed at `when`.
+        """
+        return self._write(name, {"installed": when, "replaced": when})
+
+    def snapshot(self):
+        """
+        Read-only view of the shard, rebuilt at most once per version.
+        """
+        return self.cached("snapshot", self._build_snapshot)
+
+    def snapshot_if_newer(self, version: int):
+        # Used by RemoteShard to skip shipping unchanged snapshots
+        snapshot = self.snapshot()
+        return None if snapshot["version"] == version else snapshot
+
+    def _build_snapshot(self):
+        return {
+            "tenant": self.tenant,
+            "site": self.site,
+            "version": self.version,
+            "drums": {name: dict(dates) for name, dates in self._drums.items()},
+        }
+
+    def cached(self, key, build):
+        with self._lock:
+            self._sync()
+            entry = self._cache.get(key)
+            if entry is None:
+                entry = self._cache[key] = build()
+            return entry
+
+
+# ---------------------------------------------------------
+# SHARDS IN SEPARATE WORKER PROCESSES
+# ---------------------------------------------------------
+def _serve(conn, backend_spec):
+    backend = make_backend(backend_spec)
+    shards = {}
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            return
+        if request is None:
+            return
+
+        key, method, args = request
+        if method == "exists":
+            conn.send((True, backend.version(shard_key(*key)) > 0))
+            continue
+        shard = shards.get(key)
+        if shard is None:
+            shard = shards[key] = FleetShard(*key, backend=backend)
+        try:
+            conn.send((True, getattr(shard, method)(*args)))
+        except Exception as exc:  # report back instead of killing the worker
+            conn.send((False, exc))
+
+
+class ShardWorker:
+    """
+    A child process owning a group of shards, driven over a pipe.
+    """
+
+    def __init__(self, backend_spec: str = None):
+        self._conn, child = mp.Pipe()
+        self._process = mp.Process(
+            target=_serve, args=(child, backend_spec), daemon=True
+        )
+        self._process.start()
+        self._lock = threading.Lock()
+
+    def call(self, key, method, *args):
+        with self._lock:
+            self._conn.send((key, method, args))
+            ok, result = self._conn.recv()
+        if not ok:
+            raise result
+        return result
+
+    def close(self):
+        with self._lock:
+            self._conn.send(None)
+        self._process.join(timeout=5)
+
+
+class RemoteShard:
+    """
+    Same interface as FleetShard for a shard living in a ShardWorker.
+    The last snapshot is kept locally and only refetched after a write.
+    """
+
+    def __init__(self, worker: ShardWorker, tenant: str, site: str):
+        self.tenant = tenant
+        self.site = site
+        self._worker = worker
+        self._key = (tenant, site)
+        self._snapshot = None
+
+    def register_drum(self, name: str, installed: datetime, replaced: datetime = None):
+        return self._worker.call(self._key, "register_drum", name, installed, replaced)
+
+    def set_installed(self, name: str, when: datetime):
+        return self._worker.call(self._key, "set_installed", name, when)
+
+    def snapshot(self):
+        known = self._snapshot["version"] if self._snapshot else -1
+        newer = self._worker.call(self._key, "snapshot_if_newer", known)
+        if newer is not None:
+            self._snapshot = newer
+        return self._snapshot
+
+
+# ---------------------------------------------------------
+# FLEET = ALL SHARDS
+# ---------------------------------------------------------
+class FleetState:
+    """
+    Registry of (tenant, site) shards. With `workers` > 0 shards are
+    spread over that many processes by a stable hash of the tenant, so
+    all sites of one tenant live in the same worker.
+
+    `backend_spec` selects where shard data lives (see
+    shared_state.make_backend); with "shm" or a Redis URL several
+    dashboard processes share the same fleet.
+    """
+
+    def __init__(self, workers: int = 0, backend_spec: str = None):
+        self._shards = {}
+        self._lock = threading.Lock()
+        self._backend = make_backend(backend_spec)
+        self._workers = [ShardWorker(backend_spec) for _ in range(workers)]
+
+    def shard(self, tenant: str = DEFAULT_TENANT, site: str = DEFAULT_SITE):
+        key = (tenant, site)
+        shard = self._shards.get(key)
+        if shard is not None:
+            return shard
+
+        with self._lock:
+            shard = self._shards.get(key)
+            if shard is None:
+                if self._workers:
+                    n = zlib.crc32(tenant.encode()) % len(self._workers)
+                    shard = RemoteShard(self._workers[n], tenant, site)
+                else:
+                    shard = FleetShard(tenant, site, backend=self._backend)
+                self._shards[key] = shard
+            return shard
+
+    def exists(self, tenant: str, site: str) -> bool:
+        """
+        Whether any drum was ever registered for the shard, without
+        creating it (unknown tenants must not grow the registry).
+        """
+        if (tenant, site) in self._shards:
+            return True
+        if self._workers:
+            n = zlib.crc32(tenant.encode()) % len(self._workers)
+            return self._workers[n].call((tenant, site), "exists")
+        return self._backend.version(shard_key(tenant, site)) > 0
+
+    def tenants(self):
+        return sorted({tenant for tenant, _ in self._shards})
+
+    def sites(self, tenant: str):
+        return sorted(site for t, site in self._shards if t == tenant)
+
+    def close(self):
+        for worker in self._workers:
+            worker.close()
@@ -0,0 +1,323 @@
+import argparse
+import csv
+import json
+import math
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+from drum_data import REFILL_JUMP
+from fleet_state import DEFAULT_SITE, DEFAULT_TENANT, shard_data_dir
+from history import DATA_DIR, HISTORY_FILE, HISTORY_PATH, iter_history_offsets
+
+# ---------------------------------------------------------
+# SETTINGS
+# ---------------------------------------------------------
+CACHE_FILE = "forecast_cache.json"
+FORECAST_FILE = "forecasts.json"
+FORECAST_HISTORY_FILE = "forecast_history.csv"  # every published forecast, append-only
+FORECAST_HISTORY_FIELDS = ["fitted_at", "drum", "expected", "early", "late"]
+CACHE_PATH = os.path.join(DATA_DIR, CACHE_FILE)
+FORECAST_PATH = os.path.join(DATA_DIR, FORECAST_FILE)
+
+BINS = 7 * 24               # one bin per (day-of-week, hour-of-day)
+MAX_GAP = timedelta(hours=1)  # longer gaps are not attributed to any hour
+HORIZON_HOURS = 24 * 180    # stop forecasting after ~6 months
+Z_BAND = 1.64               # ~90% uncertainty band
+WINDOW_ROWS = 500_000       # history rows folded per step; bounds the job's memory
+
+
+def _bin_of(ts: datetime) -> int:
+    return ts.weekday() * 24 + ts.hour
+
+
+def _hour_start(ts: datetime) -> datetime:
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+
+# ---------------------------------------------------------
+# MODEL: SEASONAL CONSUMPTION PROFILE (FITTED INCREMENTALLY)
+# ---------------------------------------------------------
+def empty_stats():
+    """
+    Sufficient statistics for one drum. Every closed calendar hour adds
+    one %/hour sample to its (weekday, hour) bin, so refits only need
+    the readings that arrived since the last fit.
+    """
+    return {
+        "last_ts": None,
+        "last_percent": None,
+        "open_hour": None,   # hour currently being accumulated
+        "open_used": 0.0,    # % consumed inside the open hour
+        "open_secs": 0.0,    # seconds of the open hour covered by readings
+        "count": [0] * BINS,
+        "sum": [0.0] * BINS,
+        "sumsq": [0.0] * BINS,
+    }
+
+
+def _close_hour(stats):
+    if stats["open_hour"] is None or stats["open_secs"] <= 0:
+        return
+    rate = stats["open_used"] / (stats["open_secs"] / 3600)  # % per hour
+    b = _bin_of(datetime.fromisoformat(stats["open_hour"]))
+    stats["count"][b] += 1
+    stats["sum"][b] += rate
+    stats["sumsq"][b] += rate * rate
+
+
+def update_stats(stats, readings):
+    """
+    Fold (timestamp, percent) readings into `stats`. Readings after
+    `last_ts` continue the drum's live series. Older ones are backfill
+    (an edge agent catching up after an outage): they are folded as a
+    separate series whose hours are closed right away.
+    """
+    last_ts = datetime.fromisoformat(stats["last_ts"]) if stats["last_ts"] else None
+    last_percent = stats["last_percent"]
+
+    readings = sorted(readings)
+    if last_ts is not None:
+        backfill = [r for r in readings if r[0] < last_ts]
+        if backfill:
+            segment = update_stats(empty_stats(), backfill)
+            _close_hour(segment)
+            for field in ("count", "sum", "sumsq"):
+                stats[field] = [a + b for a, b in zip(stats[field], segment[field])]
+        readings = [r for r in readings if r[0] > last_ts]
+
+    for ts, percent in readings:
+        hour = _hour_start(ts).isoformat()
+        if stats["open_hour"] != hour:
+            _close_hour(stats)
+            stats["open_hour"] = hour
+            stats["open_used"] = 0.0
+            stats["open_secs"] = 0.0
+
+        if last_ts is not None and ts - last_ts <= MAX_GAP:
+            used = last_percent - percent
+            if used >= -REFILL_JUMP:
+                stats["open_used"] += max(used, 0.0)
+                stats["open_secs"] += (ts - last_ts).total_seconds()
+
+        last_ts, last_percent = ts, percent
+
+    if last_ts is not None:
+        stats["last_ts"] = last_ts.isoformat()
+        stats["last_percent"] = last_percent
+    return stats
+
+
+def _bin_params(stats):
+    """
+    Mean and variance of the hourly rate for every bin. Empty bins fall
+    back to the drum's overall rate.
+    """
+    total_n = sum(stats["count"])
+    if total_n == 0:
+        return None
+
+    g_mean = sum(stats["sum"]) / total_n
+    g_var = max(sum(stats["sumsq"]) / total_n - g_mean * g_mean, 0.0)
+
+    params = []
+    for n, s, sq in zip(stats["count"], stats["sum"], stats["sumsq"]):
+        if n:
+            mean = s / n
+            params.append((mean, max(sq / n - mean * mean, 0.0)))
+        else:
+            params.append((g_mean, g_var))
+    return params
+
+
+def forecast_empty(stats, start: datetime = None, percent: float = None):
+    """
+    Walk the profile forward hour by hour from the latest reading.
+    Returns expected / early / late empty datetimes, or None when the
+    drum is not being consumed.
+    """
+    params = _bin_params(stats)
+    if params is None or all(mean <= 0 for mean, _ in params):
+        return None
+
+    start = start or datetime.fromisoformat(stats["last_ts"])
+    level = stats["last_percent"] if percent is None else percent
+
+    t = start
+    var = 0.0
+    expected = early = late = None
+    for _ in range(HORIZON_HOURS):
+        mean, v = params[_bin_of(t)]
+        level -= mean
+        var += v
+        sd = math.sqrt(var)
+        t += timedelta(hours=1)
+
+        if early is None and level - Z_BAND * sd <= 0:
+            early = t
+        if expected is None and level <= 0:
+            expected = t
+        if level + Z_BAND * sd <= 0:
+            late = t
+            break
+
+    if expected is None:
+        return None
+    return {
+        "expected": expected.isoformat(timespec="minutes"),
+        "early": (early or expected).isoformat(timespec="minutes"),
+        "late": late.isoformat(timespec="minutes") if late else None,
+    }
+
+
+# ---------------------------------------------------------
+# BATCH JOB (PROCESS POOL)
+# ---------------------------------------------------------
+def _fold_batch(batch):
+    """
+    Worker entry point: batch is a list of (drum, stats, readings).
+    """
+    return [(drum, update_stats(stats, readings)) for drum, stats, readings in batch]
+
+
+def _forecast_batch(batch):
+    """
+    Worker entry point: batch is a list of (drum, stats).
+    """
+    return [(drum, forecast_empty(stats)) for drum, stats in batch]
+
+
+def _batches(jobs, workers):
+    size = max(1, math.ceil(len(jobs) / (workers * 4)))
+    return [jobs[i:i + size] for i in range(0, len(jobs), size)]
+
+
+def _load_json(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_json(path, data):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)  # readers never see a half-written file
+
+
+def _append_forecast_history(path, rows):
+    new_file = not os.path.exists(path)
+    with open(path, "a", newline="") as f:
+        writer = csv.writer(f)
+        if new_file:
+            writer.writerow(FORECAST_HISTORY_FIELDS)
+        writer.writerows(rows)
+
+
+def run_forecast_job(
+    history_path: str = HISTORY_PATH,
+    cache_path: str = CACHE_PATH,
+    forecast_path: str = FORECAST_PATH,
+    workers: int = None,
+):
+    """
+    Refit only the drums that have new readings since the cached fit
+    and publish their forecasts. Returns the number of drums refitted.
+
+    New history is folded WINDOW_ROWS rows at a time and the cache is
+    saved after every window, so a long backlog needs bounded memory and
+    an interrupted run resumes where it stopped.
+    """
+    cache = _load_json(cache_path, {"offset": 0, "drums": {}})
+    drums = cache["drums"]
+    refitted = set(cache.get("unpublished", ()))  # folded by an interrupted run
+
+    # History is append-only but not time-ordered (edge agents backfill
+    # after outages), so the watermark is a byte offset, not a timestamp
+    offset = cache.get("offset")
+    since = None
+    if offset is None:  # cache written before byte offsets
+        offset = 0
+        since = datetime.fromisoformat(cache["watermark"]) if cache.get("watermark") else None
+
+    rows = iter_history_offsets(history_path, since=since, offset=offset)
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while True:
+            window = defaultdict(list)
+            n = 0
+            for end, (ts, drum, percent) in rows:
+                window[drum].append((ts, percent))
+                offset = end
+                n += 1
+                if n >= WINDOW_ROWS:
+                    break
+            if not window:
+                break
+
+            jobs = [(drum, drums.get(drum) or empty_stats(), readings) for drum, readings in window.items()]
+            for results in pool.map(_fold_batch, _batches(jobs, workers)):
+                drums.update(results)
+            refitted.update(window)
+            _write_json(
+                cache_path, {"offset": offset, "drums": drums, "unpublished": sorted(refitted)}
+            )
+            if n < WINDOW_ROWS:
+                break
+
+        if not refitted:
+            return 0
+
+        forecasts = _load_json(forecast_path, {})
+        fitted_at = datetime.now().isoformat(timespec="seconds")
+        published = []
+        jobs = [(drum, drums[drum]) for drum in sorted(refitted)]
+        for results in pool.map(_forecast_batch, _batches(jobs, workers)):
+            for drum, forecast in results:
+                if forecast is None:
+                    forecasts.pop(drum, None)
+                else:
+                    forecasts[drum] = dict(forecast, fitted_at=fitted_at)
+                    published.append(
+                        [fitted_at, drum, forecast["expected"], forecast["early"], forecast["late"] or ""]
+                    )
+
+    _write_json(forecast_path, forecasts)
+    _append_forecast_history(
+        os.path.join(os.path.dirname(forecast_path), FORECAST_HISTORY_FILE), published
+    )
+    _write_json(cache_path, {"offset": offset, "drums": drums})
+    return len(refitted)
+
+
+def load_forecasts(path: str = FORECAST_PATH):
+    return _load_json(path, {})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fit seasonal consumption forecasts.")
+    parser.add_argument(
+        "--shard-dir",
+        default=shard_data_dir(DEFAULT_TENANT, DEFAULT_SITE),
+        help="data directory of one tenant site",
+    )
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--every", type=int, default=0, help="rerun every N seconds")
+    args = parser.parse_args()
+
+    while True:
+        started = time.perf_counter()
+        n = run_forecast_job(
+            os.path.join(args.shard_dir, HISTORY_FILE),
+            os.path.join(args.shard_dir, CACHE_FILE),
+            os.path.join(args.shard_dir, FORECAST_FILE),
+            workers=args.workers,
+        )
+        print(f"Refitted {n} drum(s) in {time.perf_counter() - started:.2f}s")
+        if not args.every:
+            break
+        time.sleep(args.every)
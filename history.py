@@ -0,0 +1,136 @@
+import csv
+import fcntl
+import os
+import threading
+from datetime import datetime
+
+from shared_state import MemoryBackend
+
+# ---------------------------------------------------------
+# LEVEL HISTORY (APPEND-ONLY CSV)
+# ---------------------------------------------------------
+DATA_DIR = os.environ.get("DASHBOARD_DATA_DIR", "data")
+HISTORY_FILE = "level_history.csv"
+HISTORY_PATH = os.path.join(DATA_DIR, HISTORY_FILE)
+
+HISTORY_FIELDS = ["timestamp", "drum", "percent"]
+
+
+SENSOR_FILE = "sensor_readings.csv"
+SENSOR_FIELDS = ["timestamp", "drum", "mid_sensor", "low_sensor"]
+
+
+def append_rows(path: str, fields, rows):
+    """
+    Append rows to an append-only CSV file.
+    The file is created (with header) on first use. Writers in other
+    processes (dashboard workers, the API) are serialized with flock.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    with open(path, "a", newline="") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            writer = csv.writer(f)
+            if os.fstat(f.fileno()).st_size == 0:
+                writer.writerow(fields)
+            writer.writerows(rows)
+            f.flush()
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def append_readings(drums, when: datetime, path: str = HISTORY_PATH):
+    """
+    Append one reading per drum to the history file.
+    """
+    stamp = when.isoformat(timespec="seconds")
+    append_rows(path, HISTORY_FIELDS, ([stamp, d["name"], d["percent"]] for d in drums))
+
+
+def iter_csv_rows(path: str, offset: int = 0):
+    """
+    Stream (end_offset, row) pairs from an append-only CSV file, starting
+    at byte `offset` (0 skips the header). `end_offset` is where reading
+    can resume after that row. A torn last line is left for next time.
+    """
+    if not os.path.exists(path):
+        return
+
+    with open(path, "rb") as f:
+        if offset:
+            f.seek(offset)
+        else:
+            offset += len(f.readline())  # header
+
+        for raw in f:
+            if not raw.endswith(b"\n"):
+                return  # still being written
+            offset += len(raw)
+            line = raw.decode().rstrip("\r\n")
+            row = line.split(",") if '"' not in line else next(csv.reader([line]))
+            yield offset, row
+
+
+def iter_history(path: str = HISTORY_PATH, since: datetime = None, offset: int = 0):
+    """
+    Stream (timestamp, drum, percent) tuples from the history file
+    without loading it into memory. Rows at or before `since` are skipped.
+    """
+    for _, (ts, drum, percent) in iter_history_offsets(path, since, offset):
+        yield ts, drum, percent
+
+
+def iter_history_offsets(path: str = HISTORY_PATH, since: datetime = None, offset: int = 0):
+    """
+    Like iter_history, but yields (end_offset, (timestamp, drum, percent))
+    so long readers can checkpoint their position.
+    """
+    for end, row in iter_csv_rows(path, offset):
+        if len(row) != 3:
+            continue
+        ts = datetime.fromisoformat(row[0])
+        if since is not None and ts <= since:
+            continue
+        yield end, (ts, row[1], float(row[2]))
+
+
+class HistoryRecorder:
+    """
+    Records at most one row per drum per second, no matter how many
+    sessions rerun the script in that second. Dashboard workers sharing
+    the file (serve.py) claim each second under `key` in a shared state
+    backend first, so only one of them writes it. The file's own rows
+    can't be used for that: ingest appends edge readings with their own
+    timestamps to the same file.
+    """
+
+    def __init__(self, path: str = HISTORY_PATH, backend=None, key: str = "history"):
+        self.path = path
+        self.backend = backend or MemoryBackend()
+        self.key = key
+        self.last_stamp = None
+        self._lock = threading.Lock()
+
+    def record(self, drums, when: datetime) -> bool:
+        """
+        Returns whether this call wrote the second.
+        """
+        stamp = when.replace(microsecond=0)
+        with self._lock:
+            if stamp == self.last_stamp:
+                return False
+            self.last_stamp = stamp
+
+            claimed = []
+
+            def claim(last):
+                if last is not None and last >= stamp:
+                    return last  # another worker recorded this second
+                claimed.append(stamp)
+                return stamp
+
+            self.backend.update(self.key, claim)
+            if claimed:
+                append_readings(drums, stamp, self.path)
+            return bool(claimed)
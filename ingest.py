@@ -0,0 +1,119 @@
+import json
+import math
+import os
+import re
+import threading
+from datetime import datetime, timedelta
+
+from fleet_state import shard_data_dir
+from history import (
+    HISTORY_FIELDS,
+    HISTORY_FILE,
+    SENSOR_FIELDS,
+    SENSOR_FILE,
+    append_rows,
+)
+
+# ---------------------------------------------------------
+# CENTRAL INGEST FOR EDGE AGENTS (see edge_agent.py)
+# ---------------------------------------------------------
+# Each agent numbers its readings with an increasing `seq` from its local
+# queue. The highest seq stored per (agent, queue id) is kept next to the
+# shard's data, so a batch that is re-sent after a lost acknowledgement is
+# dropped instead of duplicated. A queue that is recreated gets a new id
+# and starts its own mark, instead of having its readings acked unseen.
+# Data is written before the mark, which makes delivery at-least-once
+# across a crash and exactly-once otherwise.
+
+MARKS_FILE = "ingest_marks.json"
+DRUM_NAME = re.compile(r"[\w .:#+()/-]{1,200}")  # no markup or CSV quoting characters
+MAX_CLOCK_SKEW = timedelta(minutes=5)  # how far ahead of the server a reading may be
+
+
+def parse_reading(reading, now: datetime = None):
+    """
+    Check one [seq, timestamp, drum, mid, low, percent] reading before it
+    reaches the history files every other job parses. Returns it with
+    the timestamp normalized; raises ValueError if anything is off,
+    including a timestamp more than MAX_CLOCK_SKEW after `now`.
+    """
+    if not isinstance(reading, list) or len(reading) != 6:
+        raise ValueError("a reading is [seq, timestamp, drum, mid, low, percent]")
+    seq, ts, drum, mid, low, percent = reading
+    if type(seq) is not int or seq < 1:
+        raise ValueError("seq must be a positive integer")
+    if not isinstance(ts, str):
+        raise ValueError("timestamp must be an ISO string")
+    ts = datetime.fromisoformat(ts)
+    if ts.tzinfo is not None:
+        raise ValueError("timestamp must be local time without a UTC offset")
+    if ts > (now or datetime.now()) + MAX_CLOCK_SKEW:
+        raise ValueError("timestamp is in the future; check the agent's clock")
+    if not isinstance(drum, str) or DRUM_NAME.fullmatch(drum) is None:
+        raise ValueError(
+            "drum must be 1-200 letters, digits, spaces or any of _ . : # + ( ) / -"
+        )
+    if type(mid) is not int or mid not in (0, 1) or type(low) is not int or low not in (0, 1):
+        raise ValueError("mid and low must be 0 or 1")
+    if percent is not None and (
+        type(percent) not in (int, float) or not math.isfinite(percent)
+    ):
+        raise ValueError("percent must be a number or null")
+    return [seq, ts.isoformat(), drum, mid, low, percent]
+
+
+class IngestStore:
+    def __init__(self):
+        self._marks = {}  # shard_dir -> {agent: seq}
+        self._lock = threading.Lock()
+
+    def _load_marks(self, shard_dir):
+        marks = self._marks.get(shard_dir)
+        if marks is None:
+            path = os.path.join(shard_dir, MARKS_FILE)
+            if os.path.exists(path):
+                with open(path) as f:
+                    marks = json.load(f)
+            else:
+                marks = {}
+            # Marks written before queue ids: {agent: seq}
+            marks = {a: m if isinstance(m, dict) else {"": m} for a, m in marks.items()}
+            self._marks[shard_dir] = marks
+        return marks
+
+    def ingest(self, tenant: str, site: str, agent: str, readings, queue: str = "") -> int:
+        """
+        Store readings given as [seq, timestamp, drum, mid, low, percent]
+        (percent may be None) from the agent's queue `queue`. Returns the
+        highest seq now stored for that queue, which the agent uses as its
+        acknowledgement. A batch with any malformed reading is rejected
+        whole with ValueError.
+        """
+        shard_dir = shard_data_dir(tenant, site)
+        now = datetime.now()
+        readings = [parse_reading(r, now) for r in readings]
+        with self._lock:
+            marks = self._load_marks(shard_dir)
+            queues = marks.setdefault(agent, {})
+            mark = queues.get(queue, 0)
+            fresh = sorted((r for r in readings if r[0] > mark), key=lambda r: r[0])
+            if not fresh:
+                return mark
+
+            append_rows(
+                os.path.join(shard_dir, SENSOR_FILE),
+                SENSOR_FIELDS,
+                ([ts, drum, mid, low] for _, ts, drum, mid, low, _ in fresh),
+            )
+            append_rows(
+                os.path.join(shard_dir, HISTORY_FILE),
+                HISTORY_FIELDS,
+                ([ts, drum, pct] for _, ts, drum, _, _, pct in fresh if pct is not None),
+            )
+
+            queues[queue] = fresh[-1][0]
+            path = os.path.join(shard_dir, MARKS_FILE)
+            with open(f"{path}.tmp", "w") as f:
+                json.dump(marks, f)
+            os.replace(f"{path}.tmp", path)
+            return queues[queue]
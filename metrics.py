@@ -0,0 +1,64 @@
+import hashlib
+import os
+import threading
+import time
+
+# ---------------------------------------------------------
+# PER-SESSION METRICS (SERVED BY api.py AT /api/v1/metrics)
+# ---------------------------------------------------------
+STALE_SECONDS = 600  # sessions silent this long are dropped from the report
+
+_LABEL_KEY = os.urandom(16)  # per process, so labels can't be mapped back to session ids
+
+
+def session_label(session_id: str) -> str:
+    """
+    Opaque label for a session in published metrics. Raw Streamlit
+    session ids must not leak: a client can reattach to a session by id.
+    """
+    return hashlib.blake2b(session_id.encode(), key=_LABEL_KEY, digest_size=8).hexdigest()
+
+
+class MetricsRegistry:
+    """
+    Latest gauges per dashboard session, e.g. refresh interval and
+    achieved rerun rate. Sessions update their own entry on every rerun;
+    reports are keyed by session_label(), never by the session id.
+    """
+
+    def __init__(self):
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def update(self, session_id: str, **values):
+        with self._lock:
+            entry = self._sessions.setdefault(session_id, {})
+            entry.update(values, updated_at=time.time())
+
+    def remove(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def snapshot(self):
+        cutoff = time.time() - STALE_SECONDS
+        with self._lock:
+            self._sessions = {k: v for k, v in self._sessions.items() if v["updated_at"] >= cutoff}
+            return {session_label(k): dict(v) for k, v in self._sessions.items()}
+
+    def prometheus(self) -> str:
+        """
+        Prometheus text format, one gauge family per numeric field.
+        """
+        sessions = self.snapshot()
+        families = {}
+        for label, values in sessions.items():
+            for name, value in values.items():
+                if name != "updated_at" and isinstance(value, (int, float)):
+                    families.setdefault(name, []).append((label, value))
+
+        lines = ["# TYPE dashboard_sessions gauge", f"dashboard_sessions {len(sessions)}"]
+        for name, samples in sorted(families.items()):
+            lines.append(f"# TYPE dashboard_session_{name} gauge")
+            for label, value in samples:
+                lines.append(f'dashboard_session_{name}{{session="{label}"}} {value}')
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,136 @@
+import os
+import threading
+import time
+from collections import deque
+
+# ---------------------------------------------------------
+# SETTINGS
+# ---------------------------------------------------------
+FAST_INTERVAL = 2.0     # seconds, a viewed drum is LOW or moving quickly
+BASE_INTERVAL = 5.0     # seconds, the old fixed interval
+SLOW_INTERVAL = 60.0    # seconds, stable values or a hidden tab
+MAX_INTERVAL = 300.0    # ceiling even under heavy server load
+BACKOFF = 1.5           # growth per rerun while nothing changes
+FAST_CHANGE = 2.0       # times the drum's normal rate that counts as "changing quickly"
+HIDDEN_LATENESS = 3.0   # rerun this many intervals late => tab is in the background
+BUDGET_WINDOW = 10.0    # seconds over which the server rerun rate is measured
+RATE_WINDOW = 60.0      # seconds over which a session's own rate is measured
+
+DEFAULT_RERUN_BUDGET = float(
+    os.environ.get("DASHBOARD_RERUN_BUDGET", 10 * (os.cpu_count() or 1))
+)
+
+
+class RerunBudget:
+    """
+    Server-wide reruns per second. When sessions together exceed it,
+    `pressure()` goes above 1 and every session stretches its interval
+    by that factor, so load levels off instead of saturating the CPU.
+    """
+
+    def __init__(self, per_second: float = DEFAULT_RERUN_BUDGET):
+        self.per_second = per_second
+        self._times = deque()
+        self._lock = threading.Lock()
+
+    def record(self, now: float):
+        with self._lock:
+            self._times.append(now)
+            while self._times and self._times[0] < now - BUDGET_WINDOW:
+                self._times.popleft()
+
+    def rate(self) -> float:
+        return len(self._times) / BUDGET_WINDOW
+
+    def pressure(self) -> float:
+        return self.rate() / self.per_second
+
+
+class RefreshScheduler:
+    """
+    Picks the next auto-refresh interval for one session:
+      - fast while a viewed drum is LOW or its level moves much faster
+        than its own normal rate, and right after the user interacts,
+      - slow while the tab looks hidden (browsers throttle background
+        timers, so the rerun arrives much later than scheduled),
+      - backing off while values are stable,
+      - everything stretched by the server-wide budget pressure.
+
+    A tab counts as hidden from its first late rerun until the user
+    interacts or a short (fast or base) interval fires on time; a slow
+    interval firing on time proves nothing, throttled timers do that too.
+    """
+
+    def __init__(self):
+        self.interval = BASE_INTERVAL
+        self.hidden = False
+        self._target = BASE_INTERVAL  # interval before budget stretching
+        self.last_interaction = None  # monotonic time of the last non-timer rerun
+        self._last_time = None
+        self._last_count = None
+        self._last_values = {}
+        self._reruns = deque()
+
+    def next_interval(
+        self, drums, refresh_count: int, budget: RerunBudget, normal_rates=None, now: float = None
+    ) -> float:
+        """
+        `normal_rates` maps drum names to their baseline consumption in
+        % per hour (AnomalyDetector.normal_rates); drums without one are
+        never treated as moving quickly.
+        """
+        now = now or time.monotonic()
+        budget.record(now)
+        self._reruns.append(now)
+        while self._reruns[0] < now - RATE_WINDOW:
+            self._reruns.popleft()
+
+        gap = now - self._last_time if self._last_time else None
+        interaction = refresh_count == self._last_count  # not triggered by the timer
+        late = gap is not None and gap > HIDDEN_LATENESS * self.interval + 1
+        if interaction or gap is None:
+            self.last_interaction = now
+
+        values = {d["name"]: d["percent"] for d in drums}
+        normal_rates = normal_rates or {}
+        fast = gap is not None and any(
+            abs(values[k] - v) / gap * 3600 > FAST_CHANGE * abs(normal_rates[k])
+            for k, v in self._last_values.items()
+            if k in values and k in normal_rates
+        )
+        changed = values != self._last_values
+        urgent = any(d["level"] == "LOW" for d in drums) or fast
+
+        if interaction:
+            self.hidden = False
+        elif late:
+            self.hidden = True
+        elif self.hidden and self._target < SLOW_INTERVAL:
+            self.hidden = False  # a short timer fired on time: visible again
+
+        if urgent:
+            target = FAST_INTERVAL
+        elif interaction:
+            target = BASE_INTERVAL
+        elif self.hidden:
+            target = SLOW_INTERVAL
+        elif changed:
+            target = BASE_INTERVAL
+        else:
+            target = min(self.interval * BACKOFF, SLOW_INTERVAL)
+
+        self._target = target
+        self.interval = min(target * max(1.0, budget.pressure()), MAX_INTERVAL)
+        self._last_time = now
+        self._last_count = refresh_count
+        self._last_values = values
+        return self.interval
+
+    def achieved_rate(self) -> float:
+        """
+        Reruns per minute this session actually got over the last minute.
+        """
+        if len(self._reruns) < 2:
+            return 0.0
+        span = max(self._reruns[-1] - self._reruns[0], 1.0)
+        return 60.0 * (len(self._reruns) - 1) / span
@@ -0,0 +1,173 @@
+import math
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from drum_data import REFILL_JUMP, classify_level
+from history import HISTORY_PATH, iter_history_offsets
+
+# ---------------------------------------------------------
+# SETTINGS
+# ---------------------------------------------------------
+MIN_SPEED = 1.0
+MAX_SPEED = 1000.0
+MAX_ROWS_PER_READ = 50_000           # history rows parsed per read (~0.2 s)
+CATCH_UP = timedelta(seconds=10)     # recording replayed after skipping ahead
+
+
+def _offset_at(path: str, start: datetime) -> int:
+    """
+    Byte offset of the first history row at or after `start`. History is
+    time-ordered apart from edge-agent backfill, so this is a binary
+    search over the file rather than a scan of everything before `start`;
+    a backfilled batch may land on either side of the offset.
+    """
+    with open(path, "rb") as f:
+        header = len(f.readline())
+        size = os.path.getsize(path)
+
+        def line_at(pos):
+            # First complete line starting at or after `pos`
+            if pos <= header:
+                f.seek(header)
+            else:
+                f.seek(pos - 1)
+                f.readline()
+            begin = f.tell()
+            return begin, f.readline()
+
+        lo, hi = header, size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            _, line = line_at(mid)
+            complete = line.endswith(b"\n")
+            if not complete or datetime.fromisoformat(line.split(b",", 1)[0].decode()) >= start:
+                hi = mid
+            else:
+                lo = mid + 1
+        return line_at(lo)[0]
+
+
+# ---------------------------------------------------------
+# VIRTUAL CLOCK
+# ---------------------------------------------------------
+class VirtualClock:
+    """
+    Replay time: starts at `start` and runs `speed` times faster than
+    the wall clock.
+    """
+
+    def __init__(self, start: datetime, speed: float = 1.0):
+        if not math.isfinite(speed):
+            raise ValueError(f"replay speed must be a finite number, got {speed!r}")
+        self.start = start
+        self.speed = min(max(speed, MIN_SPEED), MAX_SPEED)
+        self._t0 = time.monotonic()
+
+    def now(self) -> datetime:
+        return self.start + timedelta(seconds=(time.monotonic() - self._t0) * self.speed)
+
+
+# ---------------------------------------------------------
+# REPLAY SOURCE (STAND-IN FOR simulate_drum_levels)
+# ---------------------------------------------------------
+class ReplaySource:
+    """
+    Streams recorded level history up to the virtual clock. Only the
+    latest reading and install time per drum are kept, so memory grows
+    with the fleet size, not with the length of the history.
+
+    A read parses at most MAX_ROWS_PER_READ rows. When that is not enough
+    to reach the clock (a large fleet at a high speed), the source skips
+    ahead to CATCH_UP before the clock and sets `lagging`, so reruns stay
+    short instead of falling further and further behind.
+    """
+
+    def __init__(self, path: str = HISTORY_PATH, speed: float = 1.0, start: datetime = None):
+        self.path = path
+        offset = _offset_at(path, start) if start and os.path.exists(path) else 0
+        self._rows = iter_history_offsets(path, offset=offset)
+        self._pending = next(self._rows, None)
+        first = self._pending[1][0] if self._pending else datetime.now()
+        self.clock = VirtualClock(start or first, speed)
+        self.latest = {}     # drum -> percent
+        self._last_ts = {}   # drum -> timestamp of `latest`
+        self.installed = {}  # drum -> first reading or last refill
+        self.finished = self._pending is None
+        self.lagging = False
+        self._lock = threading.Lock()
+
+    def _advance(self, now: datetime):
+        budget = MAX_ROWS_PER_READ
+        skipped = False
+        while self._pending is not None and self._pending[1][0] <= now:
+            if budget == 0:
+                if skipped or not self._skip_to(now - CATCH_UP):
+                    break  # carry on from here next read
+                skipped = True
+                budget = MAX_ROWS_PER_READ
+                continue
+            budget -= 1
+            ts, drum, percent = self._pending[1]
+            self._pending = next(self._rows, None)
+            if ts < self._last_ts.get(drum, ts):
+                continue  # backfilled reading older than what is shown
+            previous = self.latest.get(drum)
+            if previous is None or percent - previous > REFILL_JUMP:
+                self.installed[drum] = ts
+            self.latest[drum] = percent
+            self._last_ts[drum] = ts
+        self.finished = self._pending is None
+        self.lagging = not self.finished and (skipped or self._pending[1][0] <= now)
+
+    def _skip_to(self, when: datetime) -> bool:
+        """
+        Continue from the first row at or after `when`, if that is ahead
+        of the current position.
+        """
+        offset = _offset_at(self.path, when)
+        if offset <= self._pending[0]:
+            return False
+        self._rows.close()
+        self._rows = iter_history_offsets(self.path, offset=offset)
+        self._pending = next(self._rows, None)
+        return True
+
+    def close(self):
+        """
+        Release the history file handle.
+        """
+        with self._lock:
+            self._rows.close()
+            self._pending = None
+            self.finished = True
+
+    def read(self, now: datetime = None):
+        """
+        Drum dicts in the same shape as simulate_drum_levels(), for every
+        drum that has a reading at or before virtual `now`.
+        """
+        now = now or self.clock.now()
+        with self._lock:
+            self._advance(now)
+            drums = []
+            for name, percent in self.latest.items():
+                level, mid_sensor, low_sensor = classify_level(percent)
+                drums.append(
+                    {
+                        "name": name,
+                        "percent": percent,
+                        "level": level,
+                        "mid_sensor": mid_sensor,
+                        "low_sensor": low_sensor,
+                    }
+                )
+            return drums
+
+    def drum_dates(self):
+        """
+        Installation dates as seen in the recording, shaped like shard data.
+        """
+        with self._lock:
+            return {name: {"installed": ts, "replaced": None} for name, ts in self.installed.items()}
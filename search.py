@@ -0,0 +1,164 @@
+import re
+import threading
+
+import numpy as np
+
+from anomaly import chemical_of
+
+# ---------------------------------------------------------
+# SETTINGS
+# ---------------------------------------------------------
+GRAM = 3              # trigram postings for tokens of 3+ characters
+MAX_CACHED_QUERIES = 64
+
+_WORD = re.compile(r"[^\s()]+")
+
+
+def _grams(text: str):
+    return {text[i:i + GRAM] for i in range(len(text) - GRAM + 1)}
+
+
+def _keys(text: str):
+    """
+    Posting keys for an indexed text: its trigrams, every whole word as
+    ("=", word), and ("^", p) for the 1- and 2-character word prefixes.
+    """
+    keys = _grams(text)
+    for word in _WORD.findall(text):
+        keys.add(("=", word))
+        keys.update(("^", word[:k]) for k in range(1, min(len(word), GRAM - 1) + 1))
+    return keys
+
+
+# ---------------------------------------------------------
+# DRUM SEARCH INDEX
+# ---------------------------------------------------------
+class DrumIndex:
+    """
+    Type-ahead search over drum name, site and chemical for one shard.
+
+    Tokens of 3+ characters match anywhere through trigram postings
+    ("EBR200G+", "200g"); shorter tokens match word prefixes ("d" finds
+    "DRUM ..."). Postings are intersected as numpy masks. Trigram hits for
+    longer tokens are confirmed with a substring test, skipped for a
+    single-token query when every hit contains the token as a whole word. Results keep
+    registration order and are cached per query until the index changes.
+
+    `sync()` indexes only the drums that are new since the last shard
+    version, so registering or replacing a drum never rebuilds the index.
+    """
+
+    def __init__(self, site: str = ""):
+        self.site = site
+        self.version = None
+        self._ids = {}       # name -> id, in registration order
+        self._names = []     # id -> name, None once removed
+        self._texts = []     # id -> lowercased searchable text
+        self._postings = {}  # key -> set of ids
+        self._arrays = {}    # key -> np.ndarray of the same ids, built on demand
+        self._name_array = None
+        self._results = {}   # query -> names
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._ids)
+
+    def _text(self, name: str) -> str:
+        return f"{name} {self.site} {chemical_of(name)}".lower()
+
+    def add(self, name: str):
+        with self._lock:
+            if name in self._ids:
+                return
+            drum_id = len(self._names)
+            text = self._text(name)
+            self._ids[name] = drum_id
+            self._names.append(name)
+            self._texts.append(text)
+            for key in _keys(text):
+                self._postings.setdefault(key, set()).add(drum_id)
+                self._arrays.pop(key, None)
+            self._name_array = None
+            self._results.clear()
+
+    def remove(self, name: str):
+        with self._lock:
+            drum_id = self._ids.pop(name, None)
+            if drum_id is None:
+                return
+            for key in _keys(self._texts[drum_id]):
+                self._postings[key].discard(drum_id)
+                self._arrays.pop(key, None)
+            self._names[drum_id] = None
+            self._name_array = None
+            self._results.clear()
+
+    def sync(self, names, version):
+        """
+        Bring the index in line with a shard snapshot's drum names.
+        A no-op while `version` is unchanged.
+        """
+        if version == self.version:
+            return
+        names = list(names)
+        for name in names:
+            if name not in self._ids:
+                self.add(name)
+        if len(self._ids) != len(names):
+            for name in set(self._ids) - set(names):
+                self.remove(name)
+        self.version = version
+
+    def _array(self, key):
+        array = self._arrays.get(key)
+        if array is None:
+            ids = self._postings.get(key, ())
+            array = self._arrays[key] = np.fromiter(ids, dtype=np.int64, count=len(ids))
+        return array
+
+    def search(self, query: str):
+        """
+        Names of drums matching every whitespace-separated token of
+        `query`, in registration order. An empty query matches everything.
+        The returned list is shared with the cache; don't modify it.
+        """
+        tokens = query.lower().split()
+        key = " ".join(tokens)
+        with self._lock:
+            names = self._results.get(key)
+            if names is not None:
+                return names
+
+            if not tokens:
+                names = [name for name in self._names if name is not None]
+            else:
+                keys, recheck = set(), []
+                for token in tokens:
+                    if len(token) >= GRAM:
+                        keys |= _grams(token)
+                        if len(token) > GRAM:
+                            recheck.append(token)
+                    else:
+                        keys.add(("^", token))
+
+                mask = None
+                for posting in sorted(keys, key=lambda k: len(self._postings.get(k, ()))):
+                    hits = np.zeros(len(self._names), dtype=bool)
+                    hits[self._array(posting)] = True
+                    mask = hits if mask is None else np.logical_and(mask, hits, out=mask)
+                ids = np.flatnonzero(mask)
+                # A single token's hits include every drum having it as a whole
+                # word, so a hit set no larger than that posting is exact. With
+                # more tokens the hits are an intersection and prove nothing.
+                if len(tokens) == 1:
+                    recheck = [t for t in recheck if len(self._postings.get(("=", t), ())) < len(ids)]
+                if recheck:
+                    ids = [i for i in ids.tolist() if all(t in self._texts[i] for t in recheck)]
+                if self._name_array is None:
+                    self._name_array = np.array(self._names, dtype=object)
+                names = self._name_array[ids].tolist()
+
+            if len(self._results) >= MAX_CACHED_QUERIES:
+                self._results.clear()
+            self._results[key] = names
+            return names
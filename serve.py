@@ -0,0 +1,59 @@
+import argparse
+import os
+import subprocess
+import sys
+
+# ---------------------------------------------------------
+# RUN SEVERAL DASHBOARD WORKERS SHARING ONE FLEET STATE
+# ---------------------------------------------------------
+# Starts one Streamlit server per port (8501, 8502, ...). All of them use
+# the same shared state backend, so an admin save on one worker shows up
+# on the others at their next rerun. Put a load balancer with sticky
+# sessions (Streamlit sessions live on a websocket) in front of the ports.
+#
+# With DASHBOARD_API_PORT set, the snapshot API runs once, as its own
+# process on that port, instead of every worker trying to bind it.
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run several dashboard workers.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--port", type=int, default=8501, help="first port")
+    parser.add_argument("--backend", default="shm", help="shm, shm:/dir or redis://...")
+    parser.add_argument("--app", default=os.path.join(os.path.dirname(__file__), "app.py"))
+    args = parser.parse_args()
+
+    env = dict(os.environ, DASHBOARD_STATE_BACKEND=args.backend)
+    api_port = env.pop("DASHBOARD_API_PORT", None)
+    here = os.path.dirname(os.path.abspath(__file__))
+    procs = [
+        subprocess.Popen(
+            [
+                sys.executable, "-m", "streamlit", "run", args.app,
+                "--server.port", str(args.port + i),
+                "--server.headless", "true",
+            ],
+            env=env,
+        )
+        for i in range(args.workers)
+    ]
+    if api_port:
+        procs.append(
+            subprocess.Popen(
+                [sys.executable, os.path.join(here, "api.py"), "--port", api_port],
+                env=env,
+            )
+        )
+
+    try:
+        for p in procs:
+            p.wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for p in procs:
+            p.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+import logging
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------
+# SETTINGS
+# ---------------------------------------------------------
+MAX_SESSIONS = int(os.environ.get("DASHBOARD_MAX_SESSIONS", "200"))
+IDLE_SECONDS = float(os.environ.get("DASHBOARD_SESSION_IDLE_SECONDS", "1800"))
+MEMORY_BUDGET = int(os.environ.get("DASHBOARD_SESSION_MEMORY_MB", "256")) * 1024 * 1024
+GONE_SECONDS = 600  # no rerun at all for this long: Streamlit already dropped it
+
+
+def state_size(value, _seen=None) -> int:
+    """
+    Rough deep size in bytes of a session_state dict: containers and
+    plain objects are followed, shared objects are counted once.
+    """
+    seen = set() if _seen is None else _seen
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(state_size(k, seen) + state_size(v, seen) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset, deque)):
+        size += sum(state_size(v, seen) for v in value)
+    elif hasattr(value, "__dict__"):
+        size += state_size(vars(value), seen)
+    return size
+
+
+def eviction_supported() -> bool:
+    """
+    Whether this Streamlit version has the runtime internals that
+    close_streamlit_session relies on. Streamlit has no public API for
+    closing a session; requirements.txt pins the version this was
+    checked against, and the result is logged when the registry is created.
+    """
+    from streamlit.runtime import Runtime
+
+    return callable(getattr(Runtime, "_get_async_objs", None)) and callable(
+        getattr(Runtime, "close_session", None)
+    )
+
+
+def close_streamlit_session(session_id: str):
+    """
+    Runtime.close_session must run on the server's event loop, not on
+    the script thread that decided to evict.
+    """
+    from streamlit.runtime import Runtime
+
+    if not Runtime.exists():
+        return
+    runtime = Runtime.instance()
+    try:
+        loop = runtime._get_async_objs().eventloop
+    except Exception:
+        logger.error("Cannot reach the Streamlit event loop; session %s left open", session_id)
+        return
+    loop.call_soon_threadsafe(runtime.close_session, session_id)
+
+
+def streamlit_session_connected(session_id: str) -> bool:
+    """
+    Whether a browser is still attached to the session. Closing an
+    attached session would leave its page frozen: Streamlit drops the
+    browser's messages but never tells it to reconnect.
+    """
+    from streamlit.runtime import Runtime
+
+    return Runtime.exists() and Runtime.instance().is_active_session(session_id)
+
+
+# ---------------------------------------------------------
+# SESSION REGISTRY (ONE PER SERVER PROCESS)
+# ---------------------------------------------------------
+class SessionRegistry:
+    """
+    Last rerun, last user interaction and session_state size of every
+    session in this process. When there are more than `max_sessions`
+    sessions, or they hold more than `memory_budget` bytes together,
+    sessions without an interaction for `idle_seconds` are dealt with,
+    longest idle first: one whose browser is gone is closed, one still
+    on screen (a kiosk) is asked to shed its heavy state on its next
+    rerun. The session running `evict()` and sessions in active use are
+    never touched.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = MAX_SESSIONS,
+        idle_seconds: float = IDLE_SECONDS,
+        memory_budget: int = MEMORY_BUDGET,
+        close=close_streamlit_session,
+        connected=streamlit_session_connected,
+    ):
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self.memory_budget = memory_budget
+        self.close = close
+        self.connected = connected
+        if close is close_streamlit_session:
+            import streamlit
+
+            if eviction_supported():
+                logger.info("Streamlit %s: idle session eviction enabled", streamlit.__version__)
+            else:
+                logger.error(
+                    "Streamlit %s: idle session eviction unavailable, sessions will not be closed",
+                    streamlit.__version__,
+                )
+        self._sessions = {}  # session_id -> (last_seen, last_active, bytes)
+        self._shed = set()   # connected sessions asked to free their state
+        self._lock = threading.Lock()
+
+    def touch(self, session_id: str, nbytes: int, last_active: float, now: float = None) -> bool:
+        """
+        Record a rerun. Returns True if the session should free its heavy
+        state now.
+        """
+        now = now or time.monotonic()
+        with self._lock:
+            self._sessions[session_id] = (now, last_active, nbytes)
+            if session_id in self._shed:
+                self._shed.discard(session_id)
+                return True
+            return False
+
+    def total_bytes(self) -> int:
+        return sum(entry[2] for entry in self._sessions.values())
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def evict(self, now: float = None, exclude: str = None):
+        """
+        Enforce the limits, never touching session `exclude` (the caller).
+        Returns the ids of the sessions closed.
+        """
+        now = now or time.monotonic()
+        with self._lock:
+            for session_id, (last_seen, _, _) in list(self._sessions.items()):
+                if now - last_seen > GONE_SECONDS:
+                    del self._sessions[session_id]
+                    self._shed.discard(session_id)
+
+            idle = sorted(
+                (active, session_id)
+                for session_id, (_, active, _) in self._sessions.items()
+                if now - active >= self.idle_seconds
+            )
+            evicted = []
+            total = sum(
+                entry[2] for session_id, entry in self._sessions.items() if session_id not in self._shed
+            )
+            for _, session_id in idle:
+                if len(self._sessions) <= self.max_sessions and total <= self.memory_budget:
+                    break
+                if session_id == exclude or session_id in self._shed:
+                    continue
+                if self.connected(session_id):
+                    self._shed.add(session_id)
+                    total -= self._sessions[session_id][2]
+                else:
+                    total -= self._sessions.pop(session_id)[2]
+                    evicted.append(session_id)
+
+        for session_id in evicted:
+            logger.info("Evicting idle session %s", session_id)
+            self.close(session_id)
+        return evicted
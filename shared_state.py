@@ -0,0 +1,209 @@
+import fcntl
+import json
+import os
+import stat
+import struct
+import threading
+import time
+from datetime import datetime
+
+# ---------------------------------------------------------
+# SHARED STATE BACKENDS
+# ---------------------------------------------------------
+# Every backend stores versioned values under string keys:
+#   version(key) -> int          cheap, called on every rerun
+#   get(key)     -> (version, value)
+#   update(key, fn) -> version   atomic read-modify-write across processes
+# Version 0 with value None means "never written".
+#
+# Values are JSON (plus datetimes), never pickle: the shm files and Redis
+# keys are reachable by other local users or hosts, and loading them must
+# not be able to run code.
+
+_HEADER = struct.Struct("<Q")
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return {"$dt": value.isoformat()}
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _object_hook(obj):
+    if len(obj) == 1 and "$dt" in obj:
+        return datetime.fromisoformat(obj["$dt"])
+    return obj
+
+
+def dumps(value) -> bytes:
+    return json.dumps(value, default=_default, separators=(",", ":")).encode()
+
+
+def loads(payload: bytes):
+    return json.loads(payload, object_hook=_object_hook)
+
+
+def _private_dir(directory: str):
+    """
+    Create `directory` as 0700 or check that an existing one is a real
+    directory owned by us and closed to others, so nobody else can plant
+    or read state files.
+    """
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    st = os.lstat(directory)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o077:
+        raise RuntimeError(
+            f"Shared state directory {directory} must be a directory owned by uid "
+            f"{os.getuid()} with mode 0700"
+        )
+
+
+class MemoryBackend:
+    """
+    Process-local backend (single dashboard process, the default).
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def version(self, key: str) -> int:
+        return self._data.get(key, (0, None))[0]
+
+    def get(self, key: str):
+        return self._data.get(key, (0, None))
+
+    def update(self, key: str, fn) -> int:
+        with self._lock:
+            version, value = self._data.get(key, (0, None))
+            self._data[key] = (version + 1, fn(value))
+            return version + 1
+
+
+class ShmBackend:
+    """
+    One file per key on a tmpfs (/dev/shm), shared by every dashboard
+    process on the host. Writers serialize with flock and publish with an
+    atomic rename, so readers never see a partial value and never block.
+    """
+
+    def __init__(self, directory: str = None):
+        if directory is None:
+            base = "/dev/shm" if os.path.isdir("/dev/shm") else "/tmp"
+            directory = os.path.join(base, f"drum-dashboard-{os.getuid()}")
+        _private_dir(directory)
+        self.directory = directory
+        self._seen = {}  # key -> ((inode, mtime_ns), version)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key.replace("/", "_"))
+
+    def _read(self, path):
+        try:
+            with open(path, "rb") as f:
+                st = os.fstat(f.fileno())
+                raw = f.read()
+        except FileNotFoundError:
+            return None, 0, None
+        (version,) = _HEADER.unpack_from(raw)
+        return (st.st_ino, st.st_mtime_ns), version, raw[_HEADER.size:]
+
+    def version(self, key: str) -> int:
+        path = self._path(key)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return 0
+        stamp = (st.st_ino, st.st_mtime_ns)
+        seen = self._seen.get(key)
+        if seen and seen[0] == stamp:
+            return seen[1]
+
+        stamp, version, _ = self._read(path)
+        self._seen[key] = (stamp, version)
+        return version
+
+    def get(self, key: str):
+        stamp, version, payload = self._read(self._path(key))
+        if payload is None:
+            return 0, None
+        self._seen[key] = (stamp, version)
+        return version, loads(payload)
+
+    def update(self, key: str, fn) -> int:
+        path = self._path(key)
+        with open(path + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                version, value = self.get(key)
+                payload = dumps(fn(value))
+                tmp = f"{path}.{os.getpid()}.tmp"
+                with open(tmp, "wb") as f:
+                    f.write(_HEADER.pack(version + 1))
+                    f.write(payload)
+                os.replace(tmp, path)
+                return version + 1
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+class RedisBackend:
+    """
+    Any Redis-compatible server (Redis, Valkey, KeyDB, ...).
+    Needs the optional `redis` package.
+    """
+
+    def __init__(self, url: str, prefix: str = "drum-dashboard"):
+        try:
+            import redis
+        except ImportError as exc:
+            raise RuntimeError(
+                "DASHBOARD_STATE_BACKEND is a redis:// URL but the 'redis' package is not installed"
+            ) from exc
+        self._redis = redis
+        self._client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def _keys(self, key: str):
+        return f"{self.prefix}:{key}:version", f"{self.prefix}:{key}:data"
+
+    def version(self, key: str) -> int:
+        return int(self._client.get(self._keys(key)[0]) or 0)
+
+    def get(self, key: str):
+        version, payload = self._client.mget(*self._keys(key))
+        if payload is None:
+            return 0, None
+        return int(version), loads(payload)
+
+    def update(self, key: str, fn) -> int:
+        version_key, data_key = self._keys(key)
+        while True:
+            with self._client.pipeline() as pipe:
+                try:
+                    pipe.watch(version_key)
+                    version, payload = pipe.mget(version_key, data_key)
+                    value = loads(payload) if payload is not None else None
+                    version = int(version or 0) + 1
+                    pipe.multi()
+                    pipe.set(data_key, dumps(fn(value)))
+                    pipe.set(version_key, version)
+                    pipe.execute()
+                    return version
+                except self._redis.WatchError:
+                    time.sleep(0.001)  # another worker wrote first; retry
+
+
+def make_backend(spec: str = None):
+    """
+    Build a backend from DASHBOARD_STATE_BACKEND:
+      "memory" (default), "shm", "shm:/some/dir" or "redis://host:port/0".
+    """
+    spec = spec or os.environ.get("DASHBOARD_STATE_BACKEND", "memory")
+    if spec == "memory":
+        return MemoryBackend()
+    if spec == "shm" or spec.startswith("shm:"):
+        return ShmBackend(spec[4:] or None)
+    if spec.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackend(spec)
+    raise ValueError(f"Unknown DASHBOARD_STATE_BACKEND: {spec!r}")
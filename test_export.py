@@ -0,0 +1,72 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+import export
+from history import HISTORY_FIELDS, HISTORY_FILE, append_rows
+
+
+class Interrupted(Exception):
+    pass
+
+
+class ExportResumeTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        start = datetime(2026, 1, 5, 9, 0)
+        rows = []
+        for minute in range(0, 180, 10):
+            ts = (start + timedelta(minutes=minute)).isoformat()
+            rows += [[ts, f"DRUM {n}", 90 - minute / (10 * n)] for n in (1, 2, 3)]
+        append_rows(os.path.join(self.dir, HISTORY_FILE), HISTORY_FIELDS, rows)
+
+        chunk_rows = export.CHUNK_ROWS
+        export.CHUNK_ROWS = 2
+        self.addCleanup(setattr, export, "CHUNK_ROWS", chunk_rows)
+
+    def _export(self, dataset, name, **kwargs):
+        out = os.path.join(self.dir, name)
+        export.export(dataset, out, shard_dir=self.dir, **kwargs)
+        with open(out) as f:
+            return f.read()
+
+    def _interrupted_export(self, dataset, name, after):
+        calls = []
+
+        def progress(done, total, rows):
+            calls.append(rows)
+            if len(calls) == after:
+                raise Interrupted
+
+        with self.assertRaises(Interrupted):
+            self._export(dataset, name, progress=progress)
+        return self._export(dataset, name)
+
+    def test_levels_resume_matches_full_export(self):
+        full = self._export("levels", "full.csv")
+        for after in range(1, 28):
+            self.assertEqual(self._interrupted_export("levels", f"part{after}.csv", after), full)
+
+    def test_rollup_resume_matches_full_export(self):
+        full = self._export("rollup", "full.csv")
+        # 3 hours x 3 drums: chunks of 2 rows end part-way through hours
+        self.assertEqual(len(full.splitlines()), 1 + 3 * 3)
+        for after in range(1, 6):
+            self.assertEqual(self._interrupted_export("rollup", f"part{after}.csv", after), full)
+
+    def test_changed_parameters_start_over(self):
+        def stop(*_):
+            raise Interrupted
+
+        until = datetime(2026, 1, 5, 9, 30)
+        with self.assertRaises(Interrupted):
+            self._export("levels", "out.csv", progress=stop)
+        restarted = self._export("levels", "out.csv", until=until)
+        self.assertEqual(restarted, self._export("levels", "fresh.csv", until=until))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+import fleet_state
+from history import HISTORY_FILE, iter_history
+from ingest import IngestStore, parse_reading
+
+TS = "2026-01-05T09:00:00"
+
+
+def reading(seq, ts=TS, drum="DRUM 1 (AZ EBR200G+)", mid=0, low=0, percent=50.0):
+    return [seq, ts, drum, mid, low, percent]
+
+
+class ParseReadingTest(unittest.TestCase):
+    def test_valid_reading_is_normalized(self):
+        self.assertEqual(
+            parse_reading(reading(1, ts="2026-01-05T09:00")),
+            [1, TS, "DRUM 1 (AZ EBR200G+)", 0, 0, 50.0],
+        )
+        self.assertIsNone(parse_reading(reading(1, percent=None))[5])
+
+    def test_rejects_malformed_readings(self):
+        future = (datetime.now() + timedelta(days=1)).isoformat()
+        bad = [
+            [1, TS, "DRUM 1", 0, 0],
+            reading(0),
+            reading(True),
+            reading("1"),
+            reading(1, ts="yesterday"),
+            reading(1, ts="2026-01-05T09:00:00+02:00"),
+            reading(1, ts=future),
+            reading(1, drum=""),
+            reading(1, drum="DRUM\n1"),
+            reading(1, drum="<img src=x onerror=alert(1)>"),
+            reading(1, drum="a,b"),
+            reading(1, drum="x" * 201),
+            reading(1, mid=2),
+            reading(1, low=True),
+            reading(1, percent=float("nan")),
+            reading(1, percent=float("inf")),
+            reading(1, percent="50"),
+        ]
+        for r in bad:
+            with self.subTest(reading=r):
+                self.assertRaises(ValueError, parse_reading, r)
+
+
+class IngestMarksTest(unittest.TestCase):
+    def setUp(self):
+        data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, data_dir)
+        self.addCleanup(setattr, fleet_state, "DATA_DIR", fleet_state.DATA_DIR)
+        fleet_state.DATA_DIR = data_dir
+        self.history = os.path.join(data_dir, "t", "s", HISTORY_FILE)
+        self.store = IngestStore()
+
+    def ingest(self, readings, queue="q1", store=None):
+        return (store or self.store).ingest("t", "s", "agent", readings, queue)
+
+    def stored(self):
+        return [(ts.isoformat(), pct) for ts, _, pct in iter_history(self.history)]
+
+    def test_resent_batch_is_not_duplicated(self):
+        batch = [
+            reading(1, "2026-01-05T09:00:00", percent=50.0),
+            reading(2, "2026-01-05T09:00:05", percent=49.0),
+        ]
+        self.assertEqual(self.ingest(batch), 2)
+        self.assertEqual(self.ingest(batch), 2)  # acknowledgement was lost
+        self.assertEqual(self.ingest(batch + [reading(3, "2026-01-05T09:00:10", percent=48.0)]), 3)
+        self.assertEqual(
+            self.stored(),
+            [("2026-01-05T09:00:00", 50.0), ("2026-01-05T09:00:05", 49.0), ("2026-01-05T09:00:10", 48.0)],
+        )
+
+    def test_marks_survive_a_restart(self):
+        self.ingest([reading(1), reading(2, "2026-01-05T09:00:05")])
+        self.assertEqual(self.ingest([reading(2, "2026-01-05T09:00:05")], store=IngestStore()), 2)
+        self.assertEqual(len(self.stored()), 2)
+
+    def test_recreated_queue_is_not_acked_unseen(self):
+        self.ingest([reading(1), reading(2, "2026-01-05T09:00:05")])
+        self.assertEqual(self.ingest([reading(1, "2026-01-05T09:01:00")], queue="q2"), 1)
+        self.assertEqual(self.stored()[-1], ("2026-01-05T09:01:00", 50.0))
+
+    def test_bad_batch_is_rejected_whole(self):
+        with self.assertRaises(ValueError):
+            self.ingest([reading(1), reading(2, drum="")])
+        self.assertEqual(self.stored(), [])
+        self.assertEqual(self.ingest([reading(1)]), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
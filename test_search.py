@@ -0,0 +1,36 @@
+import unittest
+
+from search import DrumIndex
+
+
+class DrumIndexTest(unittest.TestCase):
+    def index(self, names, site="FAB1"):
+        index = DrumIndex(site)
+        index.sync(names, 1)
+        return index
+
+    def test_multi_token_query_needs_every_token(self):
+        # "abcd" is a whole word in every T drum, X1 only has its trigrams
+        names = [f"T{i} abcd" for i in range(10)] + ["X1 abcx zbcd xyz"]
+        index = self.index(names)
+        self.assertEqual(index.search("abcd xyz"), [])
+        self.assertEqual(index.search("abcd"), names[:10])
+        self.assertEqual(index.search("xyz abcx"), ["X1 abcx zbcd xyz"])
+
+    def test_single_token_substring(self):
+        names = ["DRUM 1 (AZ EBR200G+)", "DRUM 2 (OK73)", "DRUM 3 (AZ 400K)"]
+        index = self.index(names)
+        self.assertEqual(index.search("200g"), ["DRUM 1 (AZ EBR200G+)"])
+        self.assertEqual(index.search("az"), ["DRUM 1 (AZ EBR200G+)", "DRUM 3 (AZ 400K)"])
+        self.assertEqual(index.search("d 3"), ["DRUM 3 (AZ 400K)"])
+        self.assertEqual(index.search(""), names)
+
+    def test_sync_removes_drums(self):
+        index = self.index(["DRUM 1 (A)", "DRUM 2 (B)"])
+        index.search("drum")
+        index.sync(["DRUM 2 (B)"], 2)
+        self.assertEqual(index.search("drum"), ["DRUM 2 (B)"])
+
+
+if __name__ == "__main__":
+    unittest.main()